@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# micro-benchmarks for splitting ASCII and Unicode text
+# compares the split functions with the per-character versions they replaced
+# run from the top level directory: python benchmarks/bench_split.py
+from __future__ import print_function
+
+import argparse
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from off2txt.off2txt import split_ascii_unicode, split_ascii_unicode_csv  # noqa: E402
+
+
+# per-character implementations, kept as the baseline
+
+def char_split_end_of_line(outlines_ascii, outlines_unicode, line_ascii, line_unicode):
+    if line_ascii:
+        val = u''.join(line_ascii)
+        if val.strip():
+            outlines_ascii.append(val)
+    if line_unicode:
+        val = u''.join(line_unicode)
+        if val.strip():
+            outlines_unicode.append(val)
+
+
+def char_split_ascii_unicode(options, text_runs):
+    outlines_ascii = []
+    outlines_unicode = []
+    for l in text_runs:
+        line_ascii = []
+        line_unicode = []
+        for c in l:
+            if ord(c) < 128:
+                if c in ('\n', '\r'):
+                    char_split_end_of_line(outlines_ascii, outlines_unicode, line_ascii, line_unicode)
+                    line_ascii = []
+                    line_unicode = []
+                else:
+                    line_ascii.append(c)
+            else:
+                line_unicode.append(c)
+        char_split_end_of_line(outlines_ascii, outlines_unicode, line_ascii, line_unicode)
+    return outlines_ascii, outlines_unicode
+
+
+def char_split_ascii_unicode_line(options, line):
+    line_ascii = []
+    line_unicode = []
+    for c in line:
+        if c in ('\n', '\r'):
+            continue
+        if ord(c) < 128:
+            line_ascii.append(c)
+        else:
+            line_unicode.append(c)
+    return u''.join(line_ascii), u''.join(line_unicode)
+
+
+def char_split_ascii_unicode_csv(options, text_runs):
+    outlines_ascii = []
+    outlines_unicode = []
+    for line in text_runs:
+        line_ascii = []
+        line_unicode = []
+        for cell in line:
+            if not cell:
+                line_ascii.append('')
+                line_unicode.append('')
+                continue
+            cell = cell.strip()
+            if all(ord(c) < 128 for c in cell):
+                line_ascii.append(cell)
+                line_unicode.append('')
+            else:
+                asc, uni = char_split_ascii_unicode_line(options, cell)
+                line_ascii.append(asc)
+                line_unicode.append(uni)
+        outlines_ascii.append(line_ascii)
+        outlines_unicode.append(line_unicode)
+    return outlines_ascii, outlines_unicode
+
+
+# corpora
+
+ascii_sentence = u'The quick brown fox jumps over the lazy dog, 1234567890.'
+cjk_sentence = u'敏捷的棕色狐狸跳过了懒狗，一二三四五六七八九十。'
+
+corpora = {
+    'mostly-ascii': [(ascii_sentence * 8 + u'\n') * 4 + cjk_sentence] * 200,
+    'mostly-cjk': [(cjk_sentence * 8 + u'\n') * 4 + u'ASCII'] * 200,
+    'mixed': [(ascii_sentence + u' ' + cjk_sentence + u'\r\n') * 16] * 200,
+}
+
+
+def csv_rows(runs):
+    return [run.split(u' ') for run in runs]
+
+
+def bench(label, new, old, number):
+    # outputs must agree before timing means anything
+    if new() != old():
+        raise AssertionError('%s: split output differs from baseline' % label)
+    new_time = min(timeit.repeat(new, number=number, repeat=3))
+    old_time = min(timeit.repeat(old, number=number, repeat=3))
+    print('%-24s %10.2f ms %10.2f ms %8.1fx' % (label, new_time * 1000, old_time * 1000, old_time / new_time))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark ASCII/Unicode splitting.')
+    parser.add_argument('-n', '--number', type=int, default=10, help='Iterations per timing. Default %(default)s.')
+    args = parser.parse_args(argv)
+
+    print('%-24s %13s %13s %9s' % ('corpus', 'split', 'per-char', 'speedup'))
+    for name in sorted(corpora):
+        runs = corpora[name]
+        rows = csv_rows(runs)
+        bench(name, lambda: split_ascii_unicode(None, runs), lambda: char_split_ascii_unicode(None, runs), args.number)
+        bench(name + ' csv', lambda: split_ascii_unicode_csv(None, rows), lambda: char_split_ascii_unicode_csv(None, rows), args.number)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# start up time of the off2txt command
+# runs off2txt --version and a single small file of each format in fresh
+# processes and fails if the median time goes over its target
+# run from the top level directory: python benchmarks/bench_startup.py
+from __future__ import print_function
+
+import argparse
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name, off2txt arguments, target in milliseconds
+cases = [
+    ('version', ['--version'], 150),
+    ('docx', ['tests/docx/in/01.docx'], 500),
+    ('pptx', ['tests/pptx/in/01.pptx'], 550),
+    ('xlsx', ['tests/xlsx/in/01.xlsx'], 550),
+    ('docx fast', ['--engine', 'fast', 'tests/docx/in/01.docx'], 250),
+    ('pptx fast', ['--engine', 'fast', 'tests/pptx/in/01.pptx'], 250),
+    ('xlsx fast', ['--engine', 'fast', 'tests/xlsx/in/01.xlsx'], 500),
+]
+
+
+def time_run(args, outdir):
+    cmd = [sys.executable, '-m', 'off2txt']
+    if args[0] != '--version':
+        cmd.extend(['-X', '-d', outdir])
+    cmd.extend(args)
+    start = time.time()
+    subprocess.check_call(cmd, cwd=top, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return (time.time() - start) * 1000
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark off2txt start up time.')
+    parser.add_argument('-n', '--number', type=int, default=7, help='Runs per case. Default %(default)s.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply the targets by SCALE for slower machines. Default %(default)s.')
+    args = parser.parse_args(argv)
+
+    outdir = tempfile.mkdtemp(prefix='off2txt-bench-')
+    failed = False
+    try:
+        print('%-12s %10s %10s' % ('case', 'median', 'target'))
+        for name, case_args, target in cases:
+            elapsed = median([time_run(case_args, outdir) for i in range(args.number)])
+            target *= args.scale
+            status = ''
+            if elapsed > target:
+                status = 'SLOW'
+                failed = True
+            print('%-12s %8.1fms %8.1fms %s' % (name, elapsed, target, status))
+    finally:
+        shutil.rmtree(outdir)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# throughput of each stage of an extraction on a synthetic corpus
+# times the parsers of each engine, the split functions and the writers
+# separately and reports MB/s, documents/s and peak Python memory
+# run from the top level directory: python benchmarks/bench_throughput.py
+from __future__ import print_function
+
+import argparse
+import json
+import os.path
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, top)
+sys.path.insert(0, os.path.join(top, 'benchmarks'))
+
+import corpus  # noqa: E402
+from off2txt import __version__  # noqa: E402
+from off2txt.off2txt import OutputPool, engines, split_ascii_unicode, split_ascii_unicode_csv, write_csv, write_out  # noqa: E402
+from off2txt.options import parse_opts  # noqa: E402
+
+if sys.version_info.major == 2:
+    from StringIO import StringIO
+else:
+    from io import StringIO
+
+
+formats = ('.docx', '.pptx', '.xlsx')
+
+
+def make_options(argv):
+    return parse_opts(argv + ['benchmark'], stdout=StringIO(), stderr=StringIO())
+
+
+def text_size(text_runs):
+    # bytes of UTF-8 text in a list of text runs or rows
+    size = 0
+    for l in text_runs:
+        if isinstance(l, (list, tuple)):
+            for cell in l:
+                if cell is not None:
+                    size += len(u'%s' % cell) + 1
+        else:
+            size += len(l.encode('utf8'))
+    return size
+
+
+def parse_task(engine, ext, files):
+    options = make_options(['--engine', engine])
+    proc = engines[engine][ext]
+
+    def run():
+        for f in files:
+            for l in proc(options, f):
+                pass
+    return run
+
+
+def split_task(ext, text_runs):
+    split = split_ascii_unicode_csv if ext == '.xlsx' else split_ascii_unicode
+
+    def run():
+        for runs in text_runs:
+            split(None, runs)
+    return run
+
+
+def write_task(ext, files, text_runs, is_split, outdir, csv_dialect):
+    write = write_csv if ext == '.xlsx' else write_out
+
+    def run():
+        argv = ['-X', '-d', outdir, '--csv-dialect', csv_dialect]
+        if is_split:
+            argv.append('-s')
+        options = make_options(argv)
+        options.output_pool = OutputPool(options)
+        try:
+            for f, runs in zip(files, text_runs):
+                write(options, f, runs)
+        finally:
+            options.output_pool.close()
+        errors = options.stderr.getvalue()
+        if errors:
+            raise RuntimeError(errors.strip().split('\n')[0])
+    return run
+
+
+def time_task(run, number):
+    best = None
+    for i in range(number):
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def peak_memory(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(args, result, run):
+    try:
+        seconds = time_task(run, args.number)
+        if args.memory:
+            result['peak_memory'] = peak_memory(run)
+    except Exception as e:
+        result['error'] = '%s' % e
+        return result
+
+    result['seconds'] = seconds
+    result['mb_per_s'] = result['bytes'] / seconds / (1024 * 1024) if seconds else None
+    result['docs_per_s'] = result['files'] / seconds if seconds else None
+    return result
+
+
+def bench_profile(args, profile, files, outdir):
+    results = []
+    for ext in formats:
+        paths = [f for f in files if f.endswith(ext)]
+        if not paths:
+            continue
+        input_bytes = sum(os.path.getsize(f) for f in paths)
+        base = {'profile': profile, 'format': ext[1:], 'files': len(paths)}
+
+        for engine in args.engines:
+            result = dict(base, stage='parse', engine=engine, bytes=input_bytes)
+            results.append(measure(args, result, parse_task(engine, ext, paths)))
+
+        # the split and write stages start from text that is already extracted
+        text_runs = [list(engines['fast'][ext](None, f)) for f in paths]
+        size = sum(text_size(runs) for runs in text_runs)
+
+        result = dict(base, stage='split', engine=None, bytes=size)
+        results.append(measure(args, result, split_task(ext, text_runs)))
+
+        for is_split in (False, True):
+            result = dict(base, stage='write-split' if is_split else 'write', engine=None, bytes=size)
+            results.append(measure(args, result, write_task(ext, paths, text_runs, is_split, outdir, args.csv_dialect)))
+    return results
+
+
+def result_key(result):
+    return result['profile'], result['format'], result['stage'], result['engine'] or ''
+
+
+def print_results(results, baseline):
+    print('%-6s %-5s %-12s %-8s %10s %10s %12s %9s' % ('corpus', 'fmt', 'stage', 'engine', 'MB/s', 'docs/s', 'peak mem', 'change'))
+    for r in results:
+        if 'error' in r:
+            print('%-6s %-5s %-12s %-8s error: %s' % (r['profile'], r['format'], r['stage'], r['engine'] or '', r['error']))
+            continue
+
+        change = ''
+        old = baseline.get(result_key(r))
+        if old and old.get('seconds'):
+            change = '%8.2fx' % (old['seconds'] / r['seconds'])
+
+        peak = ''
+        if r.get('peak_memory') is not None:
+            peak = '%9.1fMB' % (r['peak_memory'] / (1024.0 * 1024))
+        print('%-6s %-5s %-12s %-8s %10.2f %10.1f %12s %9s' % (r['profile'], r['format'], r['stage'], r['engine'] or '', r['mb_per_s'], r['docs_per_s'], peak, change))
+
+
+def load_baseline(filename):
+    if not filename:
+        return {}
+    with open(filename) as fp:
+        return dict((result_key(r), r) for r in json.load(fp)['results'])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark off2txt extraction throughput.')
+    parser.add_argument('--corpus', help='Directory to make the corpus in and reuse between runs. Default a temporary directory.')
+    corpus.add_corpus_arguments(parser)
+    parser.add_argument('--engine', dest='engines', action='append', choices=sorted(engines), help='Engine to time, may be repeated. Default all.')
+    parser.add_argument('-n', '--number', type=int, default=3, help='Runs per stage, the fastest is reported. Default %(default)s.')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Do not measure peak memory, which needs another run of each stage.')
+    parser.add_argument('--csv-dialect', default='plain', help='off2txt --csv-dialect for writing Excel rows. Default %(default)s.')
+    parser.add_argument('-o', '--output', help='Save the results as JSON to OUTPUT.')
+    parser.add_argument('--compare', help='Show the change in speed from the results saved in COMPARE.')
+    args = parser.parse_args(argv)
+    corpus.check_corpus_arguments(args)
+    if not args.engines:
+        args.engines = sorted(engines)
+
+    baseline = load_baseline(args.compare)
+
+    workdir = tempfile.mkdtemp(prefix='off2txt-bench-')
+    try:
+        corpus_dir = args.corpus or os.path.join(workdir, 'corpus')
+        files = corpus.make_corpus(corpus_dir, args)
+
+        outdir = os.path.join(workdir, 'out')
+        results = []
+        for profile in args.profiles:
+            results.extend(bench_profile(args, profile, files[profile], outdir))
+    finally:
+        shutil.rmtree(workdir)
+
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'corpus': corpus.corpus_params(args),
+            'results': results,
+        }
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# generates a synthetic Office corpus for the benchmarks
+# the same seed, scale and Unicode mix always give the same document text
+# run from the top level directory: python benchmarks/corpus.py DIRECTORY
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import os
+import os.path
+import random
+import sys
+
+
+# bump when the generated documents change
+corpus_format = 1
+
+ascii_words = (
+    u'the quick brown fox jumps over lazy dog office text extract split column '
+    u'report quarter revenue budget meeting agenda summary total number 2024 42'
+).split()
+
+unicode_words = (
+    u'敏捷的 棕色 狐狸 跳过 懒狗 一二三 報告 会議 予算 합계 보고서 회의 '
+    u'Ελληνικά κείμενο русский текст العربية עברית'
+).split()
+
+# fixed so the package metadata does not change between runs
+timestamp = datetime.datetime(2020, 1, 1)
+
+# name: (number of files per format, size of each) at scale 1
+# sizes are paragraphs for docx, slides for pptx and rows x columns for xlsx
+profiles = {
+    'small': {'count': 200, 'docx': 20, 'pptx': 5, 'xlsx': (50, 10)},
+    'huge': {'count': 2, 'docx': 20000, 'pptx': 500, 'xlsx': (50000, 20)},
+    'wide': {'count': 3, 'docx': 0, 'pptx': 0, 'xlsx': (2000, 1000), 'fill': 0.02},
+}
+
+
+class TextMaker(object):
+    def __init__(self, seed, unicode_ratio):
+        self.random = random.Random(seed)
+        self.unicode_ratio = unicode_ratio
+
+    def word(self):
+        if self.random.random() < self.unicode_ratio:
+            return self.random.choice(unicode_words)
+        return self.random.choice(ascii_words)
+
+    def sentence(self, words):
+        return u' '.join(self.word() for i in range(words))
+
+    def paragraph(self):
+        return self.sentence(self.random.randint(8, 40))
+
+    def cell(self):
+        # a mix of text, numbers and empty cells
+        r = self.random.random()
+        if r < 0.1:
+            return None
+        if r < 0.4:
+            return self.random.randint(0, 100000)
+        return self.sentence(self.random.randint(1, 4))
+
+
+def scaled(n, scale):
+    return max(1, int(n * scale))
+
+
+def make_docx(filename, text, paragraphs):
+    import docx
+
+    doc = docx.Document()
+    doc.core_properties.created = doc.core_properties.modified = timestamp
+    for i in range(paragraphs):
+        doc.add_paragraph(text.paragraph())
+    doc.save(filename)
+
+
+def make_pptx(filename, text, slides):
+    import pptx
+    from pptx.util import Inches
+
+    prs = pptx.Presentation()
+    prs.core_properties.created = prs.core_properties.modified = timestamp
+    layout = prs.slide_layouts[1]
+    for i in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = text.sentence(5)
+        body = slide.placeholders[1].text_frame
+        body.text = text.paragraph()
+        for j in range(4):
+            body.add_paragraph().text = text.paragraph()
+        box = slide.shapes.add_textbox(Inches(1), Inches(6), Inches(8), Inches(1))
+        box.text_frame.text = text.sentence(10)
+    prs.save(filename)
+
+
+def make_xlsx(filename, text, rows, columns, fill=None):
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    wb.properties.created = wb.properties.modified = timestamp
+    ws = wb.create_sheet('Sheet1')
+    for r in range(rows):
+        if fill is None:
+            ws.append([text.cell() for c in range(columns)])
+        else:
+            # sparse: most cells are empty
+            ws.append([text.cell() if text.random.random() < fill else None for c in range(columns)])
+    wb.save(filename)
+
+
+def corpus_params(args):
+    return {
+        'format': corpus_format,
+        'seed': args.seed,
+        'scale': args.scale,
+        'unicode': args.unicode,
+        'profiles': sorted(args.profiles),
+    }
+
+
+def corpus_files(directory):
+    files = {}
+    for profile in sorted(os.listdir(directory)):
+        path = os.path.join(directory, profile)
+        if os.path.isdir(path):
+            files[profile] = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    return files
+
+
+def make_corpus(directory, args):
+    # reuse a corpus made with the same parameters
+    params = corpus_params(args)
+    params_file = os.path.join(directory, 'corpus.json')
+    if os.path.exists(params_file):
+        with open(params_file) as fp:
+            if json.load(fp) == params:
+                return corpus_files(directory)
+
+    for profile in args.profiles:
+        spec = profiles[profile]
+        path = os.path.join(directory, profile)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for f in os.listdir(path):
+            os.remove(os.path.join(path, f))
+
+        count = scaled(spec['count'], args.scale if profile == 'small' else 1)
+        for i in range(count):
+            seed = '%s-%s-%d' % (args.seed, profile, i)
+            if spec['docx']:
+                make_docx(os.path.join(path, '%04d.docx' % i), TextMaker(seed + '-docx', args.unicode), scaled(spec['docx'], args.scale))
+            if spec['pptx']:
+                make_pptx(os.path.join(path, '%04d.pptx' % i), TextMaker(seed + '-pptx', args.unicode), scaled(spec['pptx'], args.scale))
+            rows, columns = spec['xlsx']
+            make_xlsx(os.path.join(path, '%04d.xlsx' % i), TextMaker(seed + '-xlsx', args.unicode), scaled(rows, args.scale), columns, spec.get('fill'))
+        print('%s: %d files' % (profile, len(os.listdir(path))), file=sys.stderr)
+
+    with open(params_file, 'w') as fp:
+        json.dump(params, fp)
+    return corpus_files(directory)
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--seed', default='off2txt', help='Random seed. Default %(default)s.')
+    parser.add_argument('--scale', type=float, default=0.1, help='Multiply the number of small files and the size of every file by SCALE. Default %(default)s.')
+    parser.add_argument('--unicode', type=float, default=0.3, help='Fraction of words that are Unicode. Default %(default)s.')
+    parser.add_argument('--profile', dest='profiles', action='append', choices=sorted(profiles), help='Corpus to make, may be repeated. Default all.')
+
+
+def check_corpus_arguments(args):
+    if not args.profiles:
+        args.profiles = sorted(profiles)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Make a synthetic Office corpus for benchmarking.')
+    parser.add_argument('directory', help='Directory to make the corpus in.')
+    add_corpus_arguments(parser)
+    args = parser.parse_args(argv)
+    check_corpus_arguments(args)
+    make_corpus(args.directory, args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,2 +1,4 @@
 version_info = (0, 1, 0)
 __version__ = ".".join([str(v) for v in version_info])
+
+from .api import extract  # noqa: E402,F401
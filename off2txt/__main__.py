@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# off2txt: run with python -m off2txt
+from .off2txt import run
+
+if __name__ == '__main__':
+    run()
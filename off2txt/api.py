@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# off2txt: library interface
+# extracts text in memory, with no command line options or output files
+import argparse
+import io
+import os.path
+import zipfile
+
+from .off2txt import engines, split_ascii_unicode_row, split_text_run
+
+
+formats = ('docx', 'pptx', 'xlsx')
+
+# parts that identify the format of an Office Open XML package
+format_parts = (
+    ('word/document.xml', 'docx'),
+    ('ppt/presentation.xml', 'pptx'),
+    ('xl/workbook.xml', 'xlsx'),
+)
+
+
+def is_path(source):
+    return isinstance(source, (str, type(u''))) or hasattr(source, '__fspath__')
+
+
+def open_source(source):
+    # a path, or a seekable file object, that the parsers can open
+    if is_path(source):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if hasattr(source, 'seekable') and source.seekable():
+        return source
+    return io.BytesIO(source.read())
+
+
+def source_format(source):
+    if is_path(source):
+        ext = os.path.splitext(str(source))[1].lower()[1:]
+        if ext in formats:
+            return ext
+
+    position = None
+    if not is_path(source):
+        position = source.tell()
+    try:
+        with zipfile.ZipFile(source) as zf:
+            names = set(zf.namelist())
+    except zipfile.BadZipfile:
+        raise ValueError('Not an Office Open XML file')
+    finally:
+        if position is not None:
+            source.seek(position)
+
+    for part, fmt in format_parts:
+        if part in names:
+            return fmt
+    raise ValueError('Unknown Office Open XML format')
+
+
+def iter_text_runs(options, fmt, source):
+    # a generator, so nothing is parsed until the first item is asked for
+    text_runs = None
+    if options.engine == 'fast':
+        from . import fast
+        if fmt == 'docx':
+            text_runs = fast.iter_word(options, source)
+        elif fmt == 'pptx':
+            text_runs = fast.iter_powerpoint(options, source)
+    if text_runs is None:
+        # the library engine's word() and powerpoint() return whole lists
+        text_runs = engines[options.engine]['.' + fmt](options, source)
+    for l in text_runs:
+        yield l
+
+
+def iter_split_text_runs(options, text_runs):
+    for l in text_runs:
+        yield split_text_run(options, l)
+
+
+def iter_split_rows(options, rows):
+    for row in rows:
+        yield split_ascii_unicode_row(options, row)
+
+
+def extract(source, split=False, format=None, engine='library'):
+    '''Extract text from a Word, PowerPoint or Excel document.
+
+    source is a path, the document as bytes, or a binary file object.
+    format is one of docx, pptx or xlsx and is worked out from the file
+    name or contents when not given. engine is library or fast, as for the
+    --engine option.
+
+    Returns an iterator. For Word and PowerPoint it yields paragraphs of
+    text, for Excel a sequence of cell values per row. With split, each
+    item is an (ascii, unicode) pair instead. The document is only parsed
+    once the first item is asked for.
+    '''
+    if engine not in engines:
+        raise ValueError('Unknown engine: %s' % engine)
+
+    source = open_source(source)
+    if format is None:
+        format = source_format(source)
+    if format not in formats:
+        raise ValueError('Unknown format: %s' % format)
+
+    options = argparse.Namespace(engine=engine, split=split)
+    text_runs = iter_text_runs(options, format, source)
+    if not split:
+        return text_runs
+    if format == 'xlsx':
+        return iter_split_rows(options, text_runs)
+    return iter_split_text_runs(options, text_runs)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# off2txt: extraction from the Office files inside zip and tar archives
+# each member is read into memory and handed to the parsers, so an archive
+# never has to be unpacked to disk first; outputs are named as though the
+# archive had been unpacked into the directory it is in
+#
+# an archive is one input: the manifest records it as a whole and its members
+# are extracted one after another by the same process
+import io
+import os
+import os.path
+import tarfile
+import zipfile
+
+from .off2txt import engines, extract_file, extract_file_limited, make_outdir, writerr
+
+
+def member_path(path, name):
+    # the path the member would have if the archive were unpacked where it
+    # is, None for names that would land outside of that directory
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    return os.path.join(os.path.dirname(path), *parts)
+
+
+def is_wanted(options, name):
+    # ~$ files are Office lock files
+    base = os.path.basename(name.replace('\\', '/'))
+    return os.path.splitext(base)[1] in engines[options.engine] and not base.startswith('~$')
+
+
+def zip_members(options, fp):
+    with zipfile.ZipFile(fp) as zf:
+        for info in zf.infolist():
+            if not info.filename.endswith('/') and is_wanted(options, info.filename):
+                yield info.filename, info.file_size, lambda info=info: zf.read(info)
+
+
+def tar_members(options, fp):
+    # the archive is read in one pass, compressed or not
+    with tarfile.open(fileobj=fp, mode='r|*') as tf:
+        for info in tf:
+            if info.isfile() and is_wanted(options, info.name):
+                yield info.name, info.size, lambda info=info: tf.extractfile(info).read()
+
+
+def archive_members(options, path, fp):
+    # (name, size, read) for each Office file in the archive
+    if path.lower().endswith('.zip'):
+        return zip_members(options, fp)
+    return tar_members(options, fp)
+
+
+def extract_member(options, path, name, size, read):
+    member = member_path(path, name)
+    if member is None:
+        writerr(options, 'Unsafe archive member name: %s: %s' % (path, name))
+        return
+
+    if options.max_size and size > options.max_size * 1024 * 1024:
+        from .limits import writerr_limit
+        writerr_limit(options, 'Skipped file: %s: %s: size of %dMB is over the limit of %dMB' % (path, name, size // (1024 * 1024), options.max_size))
+        return
+
+    if not options.output and not options.directory:
+        make_outdir(options, os.path.dirname(member) or os.curdir)
+
+    fp = io.BytesIO(read())
+    fp.name = member
+    ext = os.path.splitext(member)[1]
+    if options.limits:
+        extract_file_limited(options, member, ext, fp)
+    else:
+        extract_file(options, member, ext, fp)
+
+
+def extract_archive(options, path, fp):
+    try:
+        for name, size, read in archive_members(options, path, fp):
+            try:
+                extract_member(options, path, name, size, read)
+            except Exception as e:
+                # the rest of the archive is still extracted
+                writerr(options, 'Exception extracting from file: %s: %s' % (path, name), exception=e)
+    except (zipfile.BadZipfile, tarfile.TarError, EOFError, IOError, OSError) as e:
+        writerr(options, 'Exception reading archive: %s' % path, exception=e)
+        return False
+    return True
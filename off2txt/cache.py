@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+# off2txt: on-disk cache of extracted text runs
+# entries are keyed by a hash of the input file contents plus the engine and
+# off2txt version, so a hit never needs to open the Office file with a parser
+import datetime
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+
+from . import __version__
+from .logger import error
+
+
+# bump when the cache entry format changes
+cache_format = 2
+
+# an entry is a JSON header line followed by one JSON line per text run or
+# row, in UTF-8; entries are plain data so reading one never runs code
+entry_suffix = '.jsonl'
+
+# dates and times in rows are stored as {type: [fields]}
+time_types = (
+    ('datetime', datetime.datetime, ('year', 'month', 'day', 'hour', 'minute', 'second', 'microsecond')),
+    ('date', datetime.date, ('year', 'month', 'day')),
+    ('time', datetime.time, ('hour', 'minute', 'second', 'microsecond')),
+    ('timedelta', datetime.timedelta, ('days', 'seconds', 'microseconds')),
+)
+
+
+def file_digest(fp):
+    # hash an open input and rewind it for the parser
+    h = hashlib.sha256()
+    while True:
+        data = fp.read(1024 * 1024)
+        if not data:
+            break
+        h.update(data)
+    fp.seek(0)
+    return h.hexdigest()
+
+
+def cache_key(options, fp, ext):
+    h = hashlib.sha256()
+    h.update(file_digest(fp).encode('ascii'))
+    for v in (ext, options.engine, __version__, str(cache_format)):
+        h.update(b'\0')
+        h.update(v.encode('utf8'))
+    return h.hexdigest()
+
+
+def cache_path(options, key):
+    return os.path.join(options.cache_dir, key[:2], key + entry_suffix)
+
+
+def encode_value(v):
+    # datetime is a date, so it is looked for first
+    for name, cls, fields in time_types:
+        if isinstance(v, cls):
+            return {name: [getattr(v, f) for f in fields]}
+    if v is None or isinstance(v, (bool, int, float)) or isinstance(v, type(u'')):
+        return v
+    # anything else, e.g. a long or a byte string on Python 2, is kept as text
+    return u'%s' % v
+
+
+def decode_value(v):
+    if isinstance(v, dict):
+        (name, values), = v.items()
+        cls = dict((n, c) for n, c, f in time_types)[name]
+        return cls(*values)
+    return v
+
+
+def encode_line(value):
+    if isinstance(value, (tuple, list)):
+        value = [encode_value(v) for v in value]
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf8') + b'\n'
+
+
+def decode_line(line):
+    if not line.endswith(b'\n'):
+        raise ValueError('truncated entry')
+    value = json.loads(line.decode('utf8'))
+    if isinstance(value, list):
+        value = tuple(decode_value(v) for v in value)
+    return value
+
+
+def remove_entry(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def cache_hit(options, filename):
+    # the open entry and its header, None for a miss; an entry that cannot
+    # be decoded is removed and is a miss
+    try:
+        fp = open(filename, 'rb')
+    except (IOError, OSError):
+        return None
+
+    try:
+        header = decode_line(fp.readline())
+        is_list = header['is_list']
+    except Exception as e:
+        error('cache_hit: exception reading %s: %s' % (filename, e), exc_info=True)
+        fp.close()
+        remove_entry(filename)
+        return None
+
+    # touch the entry so pruning evicts least recently used entries first
+    try:
+        os.utime(filename, None)
+    except OSError:
+        pass
+    return fp, is_list
+
+
+def read_cached_runs(options, filename, fp):
+    # all text runs or None, the entry is removed if any cannot be decoded
+    with fp:
+        try:
+            return [decode_line(line) for line in fp]
+        except Exception as e:
+            error('read_cached_runs: exception reading %s: %s' % (filename, e), exc_info=True)
+    remove_entry(filename)
+    return None
+
+
+def read_cached_rows(options, filename, fp, parse):
+    # rows are decoded as they are used; if one cannot be decoded the entry
+    # is removed and the rest of the rows come from parse, which rewrites it
+    count = 0
+    with fp:
+        lines = iter(fp)
+        while True:
+            try:
+                line = next(lines, None)
+                if line is None:
+                    return
+                row = decode_line(line)
+            except Exception as e:
+                error('read_cached_rows: exception reading %s: %s' % (filename, e), exc_info=True)
+                break
+            count += 1
+            yield row
+
+    remove_entry(filename)
+    options.cache_hits -= 1
+    options.cache_misses += 1
+    for i, row in enumerate(parse()):
+        if i >= count:
+            yield row
+
+
+def open_entry(options, filename):
+    dirname = os.path.dirname(filename)
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        if not os.path.isdir(dirname):
+            raise
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    return os.fdopen(fd, 'wb'), tmp
+
+
+def write_header(fp, is_list):
+    fp.write(encode_line({'is_list': is_list}))
+
+
+def write_entry(options, filename, text_runs):
+    try:
+        fp, tmp = open_entry(options, filename)
+    except Exception as e:
+        error('write_entry: exception opening %s: %s' % (filename, e), exc_info=True)
+        return
+
+    try:
+        write_header(fp, True)
+        for l in text_runs:
+            fp.write(encode_line(l))
+    except Exception as e:
+        error('write_entry: exception writing %s: %s' % (filename, e), exc_info=True)
+        discard_entry(fp, tmp)
+    else:
+        commit_entry(fp, tmp, filename)
+
+
+def commit_entry(fp, tmp, filename):
+    # the entry only becomes visible once complete
+    fp.close()
+    try:
+        os.rename(tmp, filename)
+    except OSError as e:
+        error('commit_entry: exception renaming %s: %s' % (tmp, e), exc_info=True)
+        discard_entry(None, tmp)
+
+
+def discard_entry(fp, tmp):
+    if fp is not None:
+        fp.close()
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
+
+
+def cache_rows(options, filename, rows):
+    # store rows as they stream past, the entry is only kept if all rows were read
+    try:
+        fp, tmp = open_entry(options, filename)
+        write_header(fp, False)
+    except Exception as e:
+        error('cache_rows: exception opening %s: %s' % (filename, e), exc_info=True)
+        for row in rows:
+            yield row
+        return
+
+    try:
+        for row in rows:
+            if fp is not None:
+                try:
+                    fp.write(encode_line(row))
+                except Exception as e:
+                    # a cache failure must not fail the extraction
+                    error('cache_rows: exception writing %s: %s' % (filename, e), exc_info=True)
+                    discard_entry(fp, tmp)
+                    fp = None
+            yield row
+    except BaseException:
+        if fp is not None:
+            discard_entry(fp, tmp)
+        raise
+
+    if fp is not None:
+        commit_entry(fp, tmp, filename)
+
+
+def cached_text_runs(options, fp, ext, proc):
+    try:
+        filename = cache_path(options, cache_key(options, fp, ext))
+    except Exception as e:
+        error('cached_text_runs: exception hashing %s: %s' % (fp.name, e), exc_info=True)
+        fp.seek(0)
+        return proc(options, fp)
+
+    hit = cache_hit(options, filename)
+    if hit is not None:
+        entry, is_list = hit
+        if not is_list:
+            options.cache_hits += 1
+            return read_cached_rows(options, filename, entry, lambda: cache_rows(options, filename, proc(options, fp)))
+        text_runs = read_cached_runs(options, filename, entry)
+        if text_runs is not None:
+            options.cache_hits += 1
+            return text_runs
+
+    options.cache_misses += 1
+    text_runs = proc(options, fp)
+    if isinstance(text_runs, (list, tuple)):
+        write_entry(options, filename, text_runs)
+        return text_runs
+    return cache_rows(options, filename, text_runs)
+
+
+def prune_cache(options):
+    # evict least recently used entries until the cache fits in cache_size
+    max_size = options.cache_size * 1024 * 1024
+    entries = []
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(options.cache_dir):
+        for f in filenames:
+            # entries being written are left alone, entries in an older
+            # format are never read and are evicted like any other
+            if f.endswith('.tmp'):
+                continue
+            filename = os.path.join(dirpath, f)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+            total += st.st_size
+
+    if total <= max_size:
+        return 0
+
+    evicted = 0
+    entries.sort()
+    for mtime, size, filename in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(filename)
+        except OSError as e:
+            error('prune_cache: exception removing %s: %s' % (filename, e), exc_info=True)
+            continue
+        total -= size
+        evicted += 1
+    return evicted
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+# off2txt: fast extraction engine
+# reads text straight from the Office Open XML parts with zipfile and an
+# incremental parser instead of building python-docx/python-pptx/openpyxl objects
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+
+from lxml import etree
+
+
+REL = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+R_ID = R + 'id'
+OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = W + 'body'
+W_P = W + 'p'
+W_R = W + 'r'
+W_HYPERLINK = W + 'hyperlink'
+W_T = W + 't'
+W_TAB = W + 'tab'
+W_PTAB = W + 'ptab'
+W_BR = W + 'br'
+W_CR = W + 'cr'
+W_NO_BREAK_HYPHEN = W + 'noBreakHyphen'
+W_TYPE = W + 'type'
+
+P = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+P_SLD_ID = P + 'sldId'
+P_SP = P + 'sp'
+P_SP_TREE = P + 'spTree'
+P_TX_BODY = P + 'txBody'
+
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+A_P = A + 'p'
+A_R = A + 'r'
+A_BR = A + 'br'
+A_FLD = A + 'fld'
+A_T = A + 't'
+
+S = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+S_SST = S + 'sst'
+S_SI = S + 'si'
+S_T = S + 't'
+S_R = S + 'r'
+S_IS = S + 'is'
+S_V = S + 'v'
+S_F = S + 'f'
+S_C = S + 'c'
+S_ROW = S + 'row'
+S_SHEET_DATA = S + 'sheetData'
+S_DIMENSION = S + 'dimension'
+S_SHEET = S + 'sheet'
+S_WORKBOOK_PR = S + 'workbookPr'
+S_NUM_FMT = S + 'numFmt'
+S_CELL_XFS = S + 'cellXfs'
+S_XF = S + 'xf'
+SHARED_STRINGS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+STYLES = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles'
+
+
+def iter_end(fp, tag):
+    # iterparse with huge_tree so very large parts are not rejected
+    return etree.iterparse(fp, events=('end', ), tag=tag, huge_tree=True)
+
+
+def release(elem):
+    # free a processed element and everything before it
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def main_part(zf, default):
+    # the main part is found through the package relationships
+    try:
+        rels = etree.fromstring(zf.read('_rels/.rels'))
+    except KeyError:
+        return default
+    for rel in rels.iter(REL):
+        if rel.get('Type') == OFFICE_DOCUMENT:
+            return rel.get('Target').lstrip('/')
+    return default
+
+
+def part_rels(zf, partname):
+    # relationship id to part name for the relationships of partname
+    base, name = posixpath.split(partname)
+    try:
+        rels = etree.fromstring(zf.read(posixpath.join(base, '_rels', name + '.rels')))
+    except KeyError:
+        return {}
+
+    targets = {}
+    for rel in rels.iter(REL):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join(base, target))
+        targets[rel.get('Id')] = target
+        targets[rel.get('Type')] = target
+    return targets
+
+
+# Word
+
+def word_run_text(run, parts):
+    # same text equivalents as python-docx
+    for e in run:
+        tag = e.tag
+        if tag == W_T:
+            if e.text:
+                parts.append(e.text)
+        elif tag == W_TAB or tag == W_PTAB:
+            parts.append(u'\t')
+        elif tag == W_BR:
+            if e.get(W_TYPE, 'textWrapping') == 'textWrapping':
+                parts.append(u'\n')
+        elif tag == W_CR:
+            parts.append(u'\n')
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append(u'-')
+
+
+def word_paragraph_text(paragraph):
+    parts = []
+    for e in paragraph:
+        if e.tag == W_R:
+            word_run_text(e, parts)
+        elif e.tag == W_HYPERLINK:
+            for r in e:
+                if r.tag == W_R:
+                    word_run_text(r, parts)
+    return u''.join(parts)
+
+
+def iter_word_paragraphs(fp):
+    for _, elem in iter_end(fp, W_P):
+        parent = elem.getparent()
+        # only body level paragraphs, like python-docx Document.paragraphs
+        if parent is None or parent.tag != W_BODY:
+            continue
+        yield word_paragraph_text(elem)
+        release(elem)
+
+
+def iter_word(options, filename):
+    # filename may also be a file object
+    with zipfile.ZipFile(filename) as zf:
+        with zf.open(main_part(zf, 'word/document.xml')) as fp:
+            for text in iter_word_paragraphs(fp):
+                stripped = text.strip()
+                if stripped:
+                    yield text
+
+
+def word(options, filename):
+    return list(iter_word(options, filename))
+
+
+# PowerPoint
+
+def powerpoint_paragraph_text(paragraph):
+    parts = []
+    for e in paragraph:
+        tag = e.tag
+        if tag == A_R or tag == A_FLD:
+            t = e.find(A_T)
+            if t is not None and t.text:
+                parts.append(t.text)
+        elif tag == A_BR:
+            parts.append(u'\n')
+    return u''.join(parts)
+
+
+def iter_powerpoint_paragraphs(fp):
+    for _, elem in iter_end(fp, P_SP):
+        # only top level shapes have text frames in python-pptx, group members are skipped
+        parent = elem.getparent()
+        if parent is None or parent.tag != P_SP_TREE:
+            continue
+        tx_body = elem.find(P_TX_BODY)
+        if tx_body is not None:
+            for paragraph in tx_body.iterchildren(A_P):
+                yield powerpoint_paragraph_text(paragraph)
+        release(elem)
+
+
+def powerpoint_slides(zf):
+    # slide part names in presentation order
+    presentation = main_part(zf, 'ppt/presentation.xml')
+    targets = part_rels(zf, presentation)
+    slides = []
+    for sld_id in etree.fromstring(zf.read(presentation)).iter(P_SLD_ID):
+        target = targets.get(sld_id.get(R_ID))
+        if target:
+            slides.append(target)
+    return slides
+
+
+def iter_powerpoint(options, filename):
+    with zipfile.ZipFile(filename) as zf:
+        for slide in powerpoint_slides(zf):
+            with zf.open(slide) as fp:
+                for text in iter_powerpoint_paragraphs(fp):
+                    stripped = text.strip()
+                    if stripped:
+                        yield text
+
+
+def powerpoint(options, filename):
+    return list(iter_powerpoint(options, filename))
+
+
+def powerpoint_by_slide(options, filename):
+    # (slide number, text runs) for each slide
+    with zipfile.ZipFile(filename) as zf:
+        for number, slide in enumerate(powerpoint_slides(zf), 1):
+            with zf.open(slide) as fp:
+                yield number, [text for text in iter_powerpoint_paragraphs(fp) if text.strip()]
+
+
+# Excel
+# values and row shapes follow openpyxl read-only mode with values_only
+# sheets are parsed with xml.etree rather than lxml as its elements are much
+# cheaper to visit when every cell has to be looked at from Python
+
+def excel_text(elem):
+    # plain text of a shared or inline string, rich text runs concatenated
+    parts = []
+    for child in elem:
+        if child.tag == S_T:
+            if child.text:
+                parts.append(child.text)
+        elif child.tag == S_R:
+            for t in child:
+                if t.tag == S_T and t.text:
+                    parts.append(t.text)
+    return u''.join(parts)
+
+
+def iter_excel_end(fp, container):
+    # end events, completed children of container are dropped to bound memory
+    parent = None
+    for event, elem in ElementTree.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == container:
+                parent = elem
+            continue
+        yield elem
+        if parent is not None and elem.tag != container:
+            parent.clear()
+
+
+def excel_shared_strings(zf, partname):
+    strings = []
+    if not partname:
+        return strings
+    with zf.open(partname) as fp:
+        for elem in iter_excel_end(fp, S_SST):
+            if elem.tag == S_SI:
+                strings.append(excel_text(elem).replace('x005F_', ''))
+    return strings
+
+
+def excel_date_styles(zf, partname):
+    # indices of the cell styles that format numbers as dates or durations
+    date_styles = set()
+    timedelta_styles = set()
+    if not partname:
+        return date_styles, timedelta_styles
+
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+
+    styles = etree.fromstring(zf.read(partname))
+    custom = {}
+    for num_fmt in styles.iter(S_NUM_FMT):
+        custom[int(num_fmt.get('numFmtId'))] = num_fmt.get('formatCode')
+
+    cell_xfs = styles.find(S_CELL_XFS)
+    if cell_xfs is None:
+        return date_styles, timedelta_styles
+
+    for idx, xf in enumerate(cell_xfs.iterchildren(S_XF)):
+        num_fmt_id = int(xf.get('numFmtId', 0))
+        fmt = custom.get(num_fmt_id, BUILTIN_FORMATS.get(num_fmt_id))
+        if is_date_format(fmt):
+            date_styles.add(idx)
+        if is_timedelta_format(fmt):
+            timedelta_styles.add(idx)
+    return date_styles, timedelta_styles
+
+
+def excel_workbook(zf):
+    # (sheet name, part name) in workbook order plus the parts shared by all sheets
+    from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+    workbook = main_part(zf, 'xl/workbook.xml')
+    targets = part_rels(zf, workbook)
+    root = etree.fromstring(zf.read(workbook))
+
+    epoch = CALENDAR_WINDOWS_1900
+    workbook_pr = root.find(S_WORKBOOK_PR)
+    if workbook_pr is not None and workbook_pr.get('date1904') in ('1', 'true'):
+        epoch = CALENDAR_MAC_1904
+
+    sheets = []
+    for sheet in root.iter(S_SHEET):
+        target = targets.get(sheet.get(R_ID))
+        if target:
+            sheets.append((sheet.get('name'), target))
+    return sheets, targets.get(SHARED_STRINGS), targets.get(STYLES), epoch
+
+
+def excel_column(ref):
+    # column number from a cell reference such as AB12
+    col = 0
+    for c in ref:
+        if c <= '9':
+            break
+        col = col * 26 + ord(c) - 64
+    return col
+
+
+def excel_row_number(ref):
+    i = 0
+    while ref[i] > '9':
+        i += 1
+    return int(ref[i:])
+
+
+def excel_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+class ExcelSheetReader(object):
+    def __init__(self, shared_strings, date_styles, timedelta_styles, epoch):
+        from openpyxl.formula.translate import Translator
+        from openpyxl.utils.datetime import from_excel
+
+        self.translator = Translator
+        self.from_excel = from_excel
+        self.shared_strings = shared_strings
+        self.date_styles = date_styles
+        self.timedelta_styles = timedelta_styles
+        self.epoch = epoch
+        self.shared_formulae = {}
+
+    def formula(self, f, ref):
+        value = u'=' + (f.text or u'')
+        if f.get('t') == 'shared':
+            si = f.get('si')
+            if si in self.shared_formulae:
+                value = self.shared_formulae[si].translate_formula(ref)
+            elif f.text:
+                self.shared_formulae[si] = self.translator(value, ref)
+        return value
+
+    def value(self, c, ref, row_number, col):
+        value = None
+        for child in c:
+            tag = child.tag
+            if tag == S_V:
+                value = child.text
+            elif tag == S_F:
+                if not ref:
+                    from openpyxl.utils.cell import get_column_letter
+                    ref = '%s%d' % (get_column_letter(col), row_number)
+                return self.formula(child, ref)
+            elif tag == S_IS:
+                if c.get('t') == 'inlineStr':
+                    return excel_text(child)
+
+        if not value:
+            return None
+
+        t = c.get('t', 'n')
+        if t == 's':
+            return self.shared_strings[int(value)]
+        if t == 'n':
+            value = excel_number(value)
+            style = c.get('s')
+            if style and int(style) in self.date_styles:
+                style = int(style)
+                try:
+                    value = self.from_excel(value, self.epoch, timedelta=style in self.timedelta_styles)
+                except (OverflowError, ValueError):
+                    value = '#VALUE!'
+            return value
+        if t == 'b':
+            return bool(int(value))
+        if t == 'inlineStr':
+            return None
+        return value
+
+    def rows(self, fp):
+        self.shared_formulae = {}
+        max_col = None
+        max_row = None
+        empty_row = ()
+        counter = 1
+        row_number = 0
+        for elem in iter_excel_end(fp, S_SHEET_DATA):
+            tag = elem.tag
+            if tag == S_DIMENSION:
+                ref = elem.get('ref')
+                if ref:
+                    last = ref.split(':')[-1]
+                    max_col = excel_column(last)
+                    max_row = excel_row_number(last)
+                    empty_row = (None, ) * max_col
+                continue
+            if tag != S_ROW:
+                continue
+
+            r = elem.get('r')
+            if r:
+                row_number = int(r)
+            else:
+                row_number += 1
+            if max_row is not None and row_number > max_row:
+                break
+
+            cells = []
+            col = 0
+            for c in elem:
+                if c.tag != S_C:
+                    continue
+                ref = c.get('r')
+                if ref:
+                    col = excel_column(ref)
+                else:
+                    col += 1
+                cells.append((col, self.value(c, ref, row_number, col)))
+
+            # rows missing from the sheet XML are empty
+            while counter < row_number:
+                counter += 1
+                yield empty_row
+            if counter > row_number:
+                continue
+            counter += 1
+
+            width = max_col
+            if width is None:
+                if not cells:
+                    yield ()
+                    continue
+                width = cells[-1][0]
+            row = [None] * width
+            for col, value in cells:
+                if col <= width:
+                    row[col - 1] = value
+            yield tuple(row)
+
+
+def excel_sheet_names(filename):
+    with zipfile.ZipFile(filename) as zf:
+        return [name for name, part in excel_workbook(zf)[0]]
+
+
+def excel_sheets(options, filename, names=None):
+    # (sheet name, rows) for each sheet, or only the sheets in names
+    # the rows of a sheet must be read before moving on to the next
+    with zipfile.ZipFile(filename) as zf:
+        sheets, shared_strings, styles, epoch = excel_workbook(zf)
+        reader = None
+        for name, part in sheets:
+            if names is not None and name not in names:
+                continue
+            if reader is None:
+                date_styles, timedelta_styles = excel_date_styles(zf, styles)
+                reader = ExcelSheetReader(excel_shared_strings(zf, shared_strings), date_styles, timedelta_styles, epoch)
+            with zf.open(part) as fp:
+                yield name, reader.rows(fp)
+
+
+def excel(options, filename):
+    for name, rows in excel_sheets(options, filename):
+        for row in rows:
+            yield row
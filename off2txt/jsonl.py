@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# off2txt: JSON Lines output for --format jsonl
+# one record per paragraph or row saying where it came from, so a whole batch
+# can be written as one stream that bulk loaders read directly
+import json
+import math
+
+from .off2txt import TextRunWriter, engines, output_filename, sheet_engines, slide_engines, split_ascii_unicode_row, split_text_run
+from .stats import timed_text_runs
+
+
+def json_value(value):
+    # dates and times from Excel cells
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def json_cell(value):
+    # NaN and infinity are not JSON and bulk loaders reject them
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
+
+
+def text_record(options, path, fmt, text, **where):
+    record = {'path': path, 'format': fmt}
+    record.update(where)
+    if options.split:
+        record['ascii'], record['unicode'] = split_text_run(options, text)
+    else:
+        record['text'] = text
+    return record
+
+
+def word_records(options, path, fp):
+    # empty paragraphs are not extracted, so they are not counted either
+    for number, text in enumerate(engines[options.engine]['.docx'](options, fp), 1):
+        yield text_record(options, path, 'docx', text, paragraph=number)
+
+
+def powerpoint_records(options, path, fp):
+    for slide, text_runs in slide_engines[options.engine](options, fp):
+        for number, text in enumerate(text_runs, 1):
+            yield text_record(options, path, 'pptx', text, slide=slide, paragraph=number)
+
+
+def excel_records(options, path, fp, names=None):
+    for sheet, rows in sheet_engines[options.engine](options, fp, names=names):
+        for number, row in enumerate(rows, 1):
+            # rows without a value are left out, the row numbers show the gaps
+            if not any(cell is not None for cell in row):
+                continue
+            record = {'path': path, 'format': 'xlsx', 'sheet': sheet, 'row': number}
+            if options.split:
+                record['ascii'], record['unicode'] = split_ascii_unicode_row(options, row)
+            else:
+                record['cells'] = [json_cell(cell) for cell in row]
+            yield record
+
+
+def records(options, path, ext, fp, sheet=None):
+    if ext == '.docx':
+        return word_records(options, path, fp)
+    if ext == '.pptx':
+        return powerpoint_records(options, path, fp)
+    return excel_records(options, path, fp, None if sheet is None else [sheet])
+
+
+def write_jsonl(options, path, ext, fp, sheet=None):
+    lines = records(options, path, ext, fp, sheet=sheet)
+    if options.file_stats is not None:
+        lines = timed_text_runs(options.file_stats, lines)
+
+    # the sheets of a workbook all go to the one file
+    out = TextRunWriter(options, output_filename(options, path))
+    try:
+        for record in lines:
+            out.write(json.dumps(record, ensure_ascii=False, sort_keys=True, allow_nan=False, default=json_value))
+    finally:
+        out.close()
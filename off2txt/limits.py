@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# off2txt: per file resource limits
+# a document that takes too long, uses too much memory or would decompress to
+# too much data is skipped, and the rest of the inputs are still extracted
+import os
+import signal
+import time
+import zipfile
+
+from .off2txt import writerr
+
+
+# seconds between checks of the time and memory limits
+check_interval = 0.1
+
+
+class LimitExceeded(BaseException):
+    # not an Exception so the parsers' own error handling lets it through
+    pass
+
+
+def writerr_limit(options, line):
+    writerr(options, line, set_exit_status=False)
+    if options.exit_status != 'error':
+        options.exit_status = 'limit'
+
+
+def check_archive(options, fp):
+    # sizes from the zip directory, checked before anything is decompressed
+    try:
+        with zipfile.ZipFile(fp) as zf:
+            infos = zf.infolist()
+    except zipfile.BadZipfile:
+        # the parser reports files that are not Office files
+        return
+    finally:
+        fp.seek(0)
+
+    size = sum(i.file_size for i in infos)
+    compressed = sum(i.compress_size for i in infos)
+    if options.max_size and size > options.max_size * 1024 * 1024:
+        raise LimitExceeded('uncompressed size of %dMB is over the limit of %dMB' % (size // (1024 * 1024), options.max_size))
+    if options.max_ratio and size > options.max_ratio * max(compressed, 1):
+        raise LimitExceeded('compression ratio of %d is over the limit of %d' % (size // max(compressed, 1), options.max_ratio))
+
+
+def rss():
+    # resident memory of this process in bytes, options.py only allows
+    # --max-memory where /proc has it
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Guard(object):
+    # checks the time and memory limits from a timer signal while a file is
+    # extracted and raises LimitExceeded in the extraction when one is passed
+
+    def __init__(self, options):
+        self.options = options
+        self.timing = False
+        self.active = False
+        self.start = None
+        self.previous = None
+
+    def check(self, signum, frame):
+        if not self.active:
+            return
+        if self.options.timeout and time.time() - self.start > self.options.timeout:
+            self.active = False
+            raise LimitExceeded('took longer than %g seconds' % self.options.timeout)
+        if self.options.max_memory and rss() > self.options.max_memory * 1024 * 1024:
+            self.active = False
+            raise LimitExceeded('memory went over %dMB' % self.options.max_memory)
+
+    def __enter__(self):
+        if self.options.timeout or self.options.max_memory:
+            self.start = time.time()
+            self.previous = signal.signal(signal.SIGALRM, self.check)
+            self.timing = self.active = True
+            signal.setitimer(signal.ITIMER_REAL, check_interval, check_interval)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.timing:
+            # a signal that arrives while stopping must not raise out of here
+            self.active = False
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            if self.previous is None:
+                self.previous = signal.SIG_DFL
+            signal.signal(signal.SIGALRM, self.previous)
+            self.timing = False
+        return False
@@ -3,7 +3,6 @@ from __future__ import print_function
 
 import datetime
 import logging
-import logging.handlers
 import os
 
 # logging
@@ -34,6 +33,8 @@ def open_logging_console():
 
 
 def open_logging_file(fname):
+    import logging.handlers
+
     # make sure the destination directory exists
     try:
         os.makedirs(os.path.dirname(fname))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# off2txt: manifest of extracted files
+# records the size and modification time of each input along with the output
+# files it produced and the options that named and formatted them, so inputs
+# that have not changed can be skipped by the next run with the same options
+import json
+import os.path
+import sqlite3
+
+from .logger import error
+
+
+# commit after this many updates so an interrupted run keeps most of its work
+commit_interval = 1000
+
+schema = '''
+create table if not exists files (
+    path text primary key,
+    size integer not null,
+    mtime integer not null,
+    outputs text not null,
+    options text not null default ''
+)
+'''
+
+# options that change what is written for an input or where
+output_option_names = (
+    'engine', 'format', 'split', 'split_scripts', 'ascii', 'unicode', 'extension', 'sheets',
+    'compress', 'compress_level', 'csv_dialect', 'csv_delimiter'
+)
+
+
+def mtime_ns(st):
+    return getattr(st, 'st_mtime_ns', int(st.st_mtime * 1e9))
+
+
+def output_options(options):
+    # the options of a run as a string to compare with the recorded ones
+    values = dict((name, getattr(options, name, None)) for name in output_option_names)
+    for name in ('output', 'directory'):
+        value = getattr(options, name, None)
+        if value and value != '-':
+            value = os.path.abspath(value)
+        values[name] = value
+    return json.dumps(values, sort_keys=True)
+
+
+def open_manifest(options):
+    options.manifest_updates = 0
+    options.manifest_options = output_options(options)
+    # with --prefetch inputs are looked up on a reader thread while they are
+    # recorded on the main one
+    db = sqlite3.connect(options.manifest, check_same_thread=False)
+    db.execute(schema)
+    # manifests made before the options were recorded
+    columns = [row[1] for row in db.execute('pragma table_info(files)')]
+    if 'options' not in columns:
+        db.execute("alter table files add column options text not null default ''")
+    options.manifest_db = db
+
+
+def close_manifest(options):
+    if options.manifest_db is None:
+        return
+    try:
+        options.manifest_db.commit()
+        options.manifest_db.close()
+    except Exception as e:
+        error('close_manifest: exception closing %s: %s' % (options.manifest, e), exc_info=True)
+    options.manifest_db = None
+
+
+def manifest_key(path):
+    return os.path.abspath(path)
+
+
+def manifest_unchanged(options, path, st):
+    # the outputs of path if it has not changed since it was recorded, otherwise None
+    # a truncated combined output needs every input written to it again
+    if options.output and options.overwrite_output_files:
+        return None
+
+    row = options.manifest_db.execute(
+        'select size, mtime, outputs, options from files where path = ?', (manifest_key(path), )
+    ).fetchone()
+    if row is None:
+        return None
+
+    size, mtime, outputs, recorded_options = row
+    if size != st.st_size or mtime != mtime_ns(st) or recorded_options != options.manifest_options:
+        return None
+
+    # outputs that have been removed need to be made again
+    outputs = json.loads(outputs)
+    for f in outputs:
+        if not os.path.exists(f):
+            return None
+    return outputs
+
+
+def manifest_record(options, path, st, outputs):
+    options.manifest_db.execute(
+        'insert or replace into files (path, size, mtime, outputs, options) values (?, ?, ?, ?, ?)',
+        (manifest_key(path), st.st_size, mtime_ns(st), json.dumps(sorted(set(outputs))), options.manifest_options)
+    )
+    options.manifest_updates += 1
+    if options.manifest_updates % commit_interval == 0:
+        # output files are buffered, write them out before they are recorded
+        if options.output_pool is not None:
+            options.output_pool.flush()
+        options.manifest_db.commit()
@@ -5,27 +5,55 @@
 # (c) Simon Blanchard
 
 import codecs
+import collections
+import copy
+import csv
+import errno
+import io
+import itertools
 import os
 import os.path
+import re
 import sys
-
-from docx import Document
-from pptx import Presentation
-from openpyxl import load_workbook
+import tempfile
 
 from .logger import error, init_logging
+from .stats import add_file_stats, begin_file_stats, end_file_stats, lap, output_size, start_stats, timed_text_runs, timer, write_stats
+
 
+# runs of ASCII characters, removed to leave the Unicode text
+ascii_re = re.compile(u'[\x00-\x7f]+')
+# a character that is not ASCII
+non_ascii_re = re.compile(u'[^\x00-\x7f]')
 
 if sys.version_info.major == 2:
+    from StringIO import StringIO
 
     def is_astring(options, cell):
         return isinstance(cell, (str, unicode))
 
+    def is_ascii(s):
+        return not non_ascii_re.search(s)
+
+    def fsdecode(name):
+        return name.decode(sys.getfilesystemencoding() or 'utf-8')
+
 else:
+    from io import StringIO
 
     def is_astring(options, cell):
         return isinstance(cell, (str))
 
+    if hasattr(str, 'isascii'):
+        def is_ascii(s):
+            return s.isascii()
+    else:
+        # str.isascii is new in 3.7
+        def is_ascii(s):
+            return not non_ascii_re.search(s)
+
+    fsdecode = os.fsdecode
+
 
 def writerr(options, line, exception=None, set_exit_status=True):
     if set_exit_status:
@@ -71,10 +99,30 @@ def check_file_access(options, path):
     return True
 
 
-def powerpoint(options, filename):
-    text_runs = []
+def open_input(options, path):
+    # the open is the access check, the open file is then handed to the parser
+    try:
+        return open(path, 'rb')
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            writerr_file_access(options, 'File is not readable: %s' % path)
+            error('open_input: exception for %s: %s' % (path, e), exc_info=True)
+        elif os.path.islink(path):
+            writerr_file_access(options, 'Broken symlink: %s' % path)
+        else:
+            writerr_file_access(options, 'File does not exist: %s' % path)
+    return None
+
+
+# the Office libraries are slow to import so each is only loaded on first use
+
+def powerpoint_by_slide(options, filename):
+    # (slide number, text runs) for each slide
+    from pptx import Presentation
+
     prs = Presentation(filename)
-    for slide in prs.slides:
+    for number, slide in enumerate(prs.slides, 1):
+        text_runs = []
         for shape in slide.shapes:
             if not shape.has_text_frame:
                 continue
@@ -82,10 +130,19 @@ def powerpoint(options, filename):
                 stripped = paragraph.text.strip()
                 if stripped:
                     text_runs.append(paragraph.text)
+        yield number, text_runs
+
+
+def powerpoint(options, filename):
+    text_runs = []
+    for number, slide_text_runs in powerpoint_by_slide(options, filename):
+        text_runs.extend(slide_text_runs)
     return text_runs
 
 
 def word(options, filename):
+    from docx import Document
+
     text_runs = []
     doc = Document(filename)
     for paragraph in doc.paragraphs:
@@ -95,65 +152,294 @@ def word(options, filename):
     return text_runs
 
 
+def excel_sheets(options, filename, names=None):
+    # (sheet name, rows) for each sheet, or only the sheets in names
+    # the rows of a sheet must be read before moving on to the next
+    from openpyxl import load_workbook
+
+    # read only mode streams rows from the sheet XML rather than loading the
+    # whole workbook, so only one row is held in memory at a time
+    wb = load_workbook(filename=filename, read_only=True)
+    try:
+        for s in wb.sheetnames:
+            if names is None or s in names:
+                yield s, wb[s].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
 def excel(options, filename):
-    text_runs = []
-    wb = load_workbook(filename=filename)
-    for s in wb.get_sheet_names():
-        ws = wb.get_sheet_by_name(s)
-        for row in ws.rows:
-            this_row = []
-            for cell in row:
-                this_row.append(cell.value)
-            text_runs.append(this_row)
-    return text_runs
+    for name, rows in excel_sheets(options, filename):
+        for row in rows:
+            yield row
 
 
 def write_line_txt(options, fp, line):
-    fp.write(line)
-    fp.write(u'\n\n')
+    fp.write(line + u'\n\n')
 
 
 def write_line_csv(options, fp, line):
-    fp.write(u', '.join(line))
-    fp.write(u'\n')
+    try:
+        fp.write(u', '.join(line) + u'\n')
+    except TypeError:
+        # blank and number cells, only unsplit rows have them
+        fp.write(u', '.join(u'' if c is None else u'%s' % c for c in line) + u'\n')
+
+
+def write_line_jsonl(options, fp, line):
+    fp.write(line + u'\n')
+
+
+# --csv-dialect that joins cells with a comma and a space, without quoting
+plain_csv_dialect = 'plain'
+
+# rows handed to csv.writer.writerows at a time
+csv_batch_size = 1000
+
+
+def csv_format(options):
+    # csv.writer arguments for --csv-dialect and --csv-delimiter
+    kwargs = {'dialect': options.csv_dialect}
+    if options.csv_delimiter:
+        kwargs['delimiter'] = options.csv_delimiter
+    return kwargs
+
+
+# output files kept open at once, and the buffer size of each
+output_pool_size = 32
+output_buffer_size = 1024 * 1024
+
+
+# --compress modules, their level argument and the suffix added to output file names
+compressors = {
+    'gzip': ('gzip', 'compresslevel', '.gz'),
+    'bz2': ('bz2', 'compresslevel', '.bz2'),
+    'xz': ('lzma', 'preset', '.xz'),
+}
+
+
+def open_output(options, filename, mode):
+    if not options.compress:
+        return io.open(filename, mode, encoding='utf8', newline='', buffering=output_buffer_size)
+
+    # appending adds a new compressed stream, which all three read back as one
+    module, level, suffix = compressors[options.compress]
+    kwargs = {}
+    if options.compress_level is not None:
+        kwargs[level] = options.compress_level
+    return __import__(module).open(filename, mode + 't', encoding='utf8', newline='', **kwargs)
+
+
+class OutputPool(object):
+    # output files stay open for the whole run, so an output shared by many
+    # inputs is opened once; the least recently used is closed when too many
+    # are open
+
+    def __init__(self, options, size=output_pool_size):
+        self.options = options
+        self.size = size
+        self.files = collections.OrderedDict()
+        self.opened = set()
+
+    def get(self, filename, mode):
+        fp = self.files.pop(filename, None)
+        if fp is None:
+            # only truncate the first time a file is opened in a run
+            if filename in self.opened:
+                mode = 'a'
+            if len(self.files) >= self.size:
+                self.close_file(*self.files.popitem(last=False))
+            fp = open_output(self.options, filename, mode)
+            self.opened.add(filename)
+        self.files[filename] = fp
+        return fp
+
+    def discard(self, filename):
+        fp = self.files.pop(filename, None)
+        if fp is not None:
+            self.close_file(filename, fp)
+
+    def close_file(self, filename, fp):
+        try:
+            fp.close()
+        except Exception as e:
+            writerr(self.options, 'Exception writing output file: %s' % filename, exception=e)
+
+    def flush(self):
+        for filename, fp in list(self.files.items()):
+            try:
+                fp.flush()
+            except Exception as e:
+                self.files.pop(filename)
+                writerr(self.options, 'Exception writing output file: %s' % filename, exception=e)
+
+    def close(self):
+        while self.files:
+            self.close_file(*self.files.popitem(last=False))
+
+
+# output file name meaning standard output
+stdout_name = '-'
+
+
+def open_stdout(options):
+    # write UTF-8 to the underlying binary stream when there is one
+    buffer = getattr(options.stdout, 'buffer', None)
+    if buffer is None:
+        return options.stdout
+    options.stdout.flush()
+    return codecs.getwriter('utf8')(buffer)
+
+
+class TextRunWriter(object):
+    # writes lines to an output file that is only created on the first write,
+    # so that empty extractions do not leave empty files behind
+
+    def __init__(self, options, filename, is_csv=False):
+        self.options = options
+        self.filename = filename
+        self.is_csv = is_csv
+        self.fp = None
+        self.failed = False
+        self.stats = options.file_stats
+        self.rows = None
+        # running in a worker process: the temp file the lines go to
+        self.spool = None
+
+        # setup line output
+        if is_csv and options.csv_dialect != plain_csv_dialect:
+            # the csv module quotes and converts the cells of a batch of rows in C
+            self.rows = []
+            self.write_line = self.batch_row
+        elif is_csv:
+            self.write_line = write_line_csv
+        elif options.format == 'jsonl':
+            self.write_line = write_line_jsonl
+        else:
+            self.write_line = write_line_txt
+
+    def open(self):
+        # setup mode
+        mode = 'a'
+        if self.options.overwrite_output_files:
+            mode = 'w'
+
+        self.options.did_extract = True
+        if self.options.deferred_writes is not None:
+            # the parent appends the temp file to the output, in input order
+            fd, self.spool = tempfile.mkstemp(prefix='off2txt-')
+            self.fp = io.open(fd, 'w', encoding='utf8', newline='', buffering=output_buffer_size)
+            return
+        if self.filename == stdout_name:
+            self.fp = open_stdout(self.options)
+            return
+
+        if self.options.outputs is not None:
+            self.options.outputs.append(self.filename)
+        if self.options.output_pool is not None:
+            self.fp = self.options.output_pool.get(self.filename, mode)
+        else:
+            self.fp = open_output(self.options, self.filename, mode)
+        if self.options.output_sizes is not None and self.filename not in self.options.output_sizes:
+            # what was there before this input, to cut the file back to if
+            # the input passes a limit
+            self.options.output_sizes[self.filename] = os.path.getsize(self.filename)
+
+    def write(self, line):
+        if self.failed:
+            return
+
+        if self.stats is not None:
+            self.stats['bytes_out'] += output_size(line, self.is_csv)
+
+        try:
+            if self.fp is None:
+                self.open()
+            self.write_line(self.options, self.fp, line)
+        except Exception as e:
+            self.write_failed(e)
+
+    def write_spool(self, spool):
+        # the lines a worker wrote to a temp file, already formatted
+        if self.failed:
+            return
+
+        try:
+            with io.open(spool, encoding='utf8', newline='') as fp:
+                for chunk in iter(lambda: fp.read(output_buffer_size), u''):
+                    if self.fp is None:
+                        self.open()
+                    self.fp.write(chunk)
+        except Exception as e:
+            self.write_failed(e)
+
+    def write_failed(self, e):
+        self.failed = True
+        if self.fp is not None and self.options.output_pool is not None:
+            self.options.output_pool.discard(self.filename)
+            self.fp = None
+        writerr(self.options, 'Exception writing output file: %s' % self.filename, exception=e)
+
+    def batch_row(self, options, fp, line):
+        self.rows.append(line)
+        if len(self.rows) >= csv_batch_size:
+            self.write_rows()
+
+    def write_rows(self):
+        rows = self.rows
+        self.rows = []
+        csv.writer(self.fp, **csv_format(self.options)).writerows(rows)
+
+    def close(self):
+        if self.fp is not None:
+            try:
+                if self.rows and not self.failed:
+                    self.write_rows()
+                # pooled files are closed by the pool at the end of the run
+                if self.filename == stdout_name:
+                    self.fp.flush()
+                elif self.options.output_pool is None:
+                    self.fp.close()
+            except Exception as e:
+                if self.filename != stdout_name and self.options.output_pool is not None:
+                    self.options.output_pool.discard(self.filename)
+                self.failed = True
+                writerr(self.options, 'Exception writing output file: %s' % self.filename, exception=e)
+            self.fp = None
+
+        if self.spool is not None:
+            if self.failed:
+                remove_spool(self.spool)
+            else:
+                self.options.deferred_writes.append((self.filename, self.spool))
+            self.spool = None
+
+
+def remove_spool(spool):
+    try:
+        os.remove(spool)
+    except OSError as e:
+        error('remove_spool: exception for %s: %s' % (spool, e))
 
 
 def write_text_runs(options, filename, text_runs, is_csv=False):
     if not text_runs:
         return
 
-    options.did_extract = True
-
-    # setup mode
-    mode = 'a'
-    if options.overwrite_output_files:
-        mode = 'w'
+    out = TextRunWriter(options, filename, is_csv=is_csv)
+    try:
+        for l in text_runs:
+            out.write(l)
+    finally:
+        out.close()
 
-    # setup line output
-    if is_csv:
-        write_line = write_line_csv
-    else:
-        write_line = write_line_txt
 
-    try:
-        with codecs.open(filename, mode, 'utf8') as fp:
-            for l in text_runs:
-                write_line(options, fp, l)
-    except Exception as e:
-        writerr(options, 'Exception writing output file: %s' % filename, exception=e)
+def ascii_text(s):
+    return s.encode('ascii', 'ignore').decode('ascii')
 
 
-def split_end_of_line(outlines_ascii, outlines_unicode, line_ascii, line_unicode):
-    if line_ascii:
-        val = u''.join(line_ascii)
-        stripped = val.strip()
-        if stripped:
-            outlines_ascii.append(val)
-    if line_unicode:
-        val = u''.join(line_unicode)
-        stripped = val.strip()
-        if stripped:
-            outlines_unicode.append(val)
+def unicode_text(s):
+    return ascii_re.sub(u'', s)
 
 
 def split_ascii_unicode(options, text_runs):
@@ -167,52 +453,73 @@ def split_ascii_unicode(options, text_runs):
     outlines_unicode = []
 
     for l in text_runs:
-        line_ascii = []
-        line_unicode = []
-        for c in l:
-            val = ord(c)
-            if val < 128:
-                # end of line
-                if c in ('\n', '\r'):
-                    split_end_of_line(outlines_ascii, outlines_unicode, line_ascii, line_unicode)
-                    line_ascii = []
-                    line_unicode = []
-                else:
-                    line_ascii.append(c)
-            else:
-                line_unicode.append(c)
-        split_end_of_line(outlines_ascii, outlines_unicode, line_ascii, line_unicode)
+        # lines end at \n or \r, lines that are only whitespace are dropped
+        lines = l.replace(u'\r', u'\n').split(u'\n')
+        if is_ascii(l):
+            for line in lines:
+                if line.strip():
+                    outlines_ascii.append(line)
+            continue
+
+        for line in lines:
+            if is_ascii(line):
+                if line.strip():
+                    outlines_ascii.append(line)
+                continue
+            val = ascii_text(line)
+            if val.strip():
+                outlines_ascii.append(val)
+            val = unicode_text(line)
+            if val.strip():
+                outlines_unicode.append(val)
 
     return outlines_ascii, outlines_unicode
 
 
+def split_text_run(options, text):
+    # one text run split into an ascii and a unicode string
+    outlines_ascii, outlines_unicode = split_ascii_unicode(options, [text])
+    return u'\n'.join(outlines_ascii), u'\n'.join(outlines_unicode)
+
+
 def split_ascii_unicode_line(options, line):
     if not line:
         return None, None
 
+    line_ascii = ascii_text(line).replace(u'\n', u'').replace(u'\r', u'')
+    return line_ascii, unicode_text(line)
+
+
+def is_ascii_cell(options, cell):
+    return is_ascii(cell)
+
+
+def split_ascii_unicode_row(options, line):
     line_ascii = []
     line_unicode = []
+    for cell in line:
+        # blank
+        if not cell:
+            line_ascii.append('')
+            line_unicode.append('')
+            continue
 
-    for c in line:
-        # end of line
-        if c in ('\n', '\r'):
+        # number
+        if not is_astring(options, cell):
+            line_ascii.append(str(cell))
+            line_unicode.append(str(cell))
             continue
 
-        val = ord(c)
-        if val < 128:
-            line_ascii.append(c)
+        cell = cell.strip()
+        if is_ascii(cell):
+            line_ascii.append(cell)
+            line_unicode.append('')
         else:
-            line_unicode.append(c)
+            asc, uni = split_ascii_unicode_line(options, cell)
+            line_ascii.append(asc)
+            line_unicode.append(uni)
 
-    return ''.join(line_ascii), ''.join(line_unicode)
-
-
-def is_ascii_cell(options, cell):
-    for c in cell:
-        val = ord(c)
-        if val >= 128:
-            return False
-    return True
+    return line_ascii, line_unicode
 
 
 def split_ascii_unicode_csv(options, text_runs):
@@ -223,74 +530,91 @@ def split_ascii_unicode_csv(options, text_runs):
     outlines_unicode = []
 
     for line in text_runs:
-        line_ascii = []
-        line_unicode = []
-        for cell in line:
-            # blank
-            if not cell:
-                line_ascii.append('')
-                line_unicode.append('')
-                continue
-
-            # number
-            if not is_astring(options, cell):
-                line_ascii.append(str(cell))
-                line_unicode.append(str(cell))
-                continue
-
-            cell = cell.strip()
-            if is_ascii_cell(options, cell):
-                line_ascii.append(cell)
-                line_unicode.append('')
-            else:
-                asc, uni = split_ascii_unicode_line(options, cell)
-                line_ascii.append(asc)
-                line_unicode.append(uni)
-
+        line_ascii, line_unicode = split_ascii_unicode_row(options, line)
         outlines_ascii.append(line_ascii)
         outlines_unicode.append(line_unicode)
 
     return outlines_ascii, outlines_unicode
 
 
-def output_filename_split(options, filename):
-    ascii_name = output_filename(options, filename)
-    unicode_name = output_filename(options, filename, is_unicode=True)
+def output_filename_split(options, filename, sheet=None):
+    ascii_name = output_filename(options, filename, sheet=sheet)
+    unicode_name = output_filename(options, filename, is_unicode=True, sheet=sheet)
     return ascii_name, unicode_name
 
 
-def make_outdir(options):
-    if options.directory:
-        if not os.path.exists(options.directory):
-            path = ''
-            for p in options.directory.split('/'):
-                path = os.path.join(path, p)
-                if not os.path.exists(path):
-                    try:
-                        os.mkdir(path)
-                    except Exception as e:
-                        writerr(options, 'Exception making directory: %s' % path, exception=e)
-
-
-def output_filename(options, filename, is_unicode=False):
+def make_outdir(options, directory):
+    # each directory is only checked once per run
+    if directory in options.made_dirs:
+        return
+    options.made_dirs.add(directory)
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if not os.path.isdir(directory):
+            writerr(options, 'Exception making directory: %s' % directory, exception=e)
+
+
+# characters that cannot be used in a file name, Excel allows some of them in sheet names
+sheet_filename_re = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def sheet_file_names(fp):
+    # sheet name to the name its output files are given; sheets whose names
+    # only differ in characters that are replaced, or in case, are numbered
+    # so they do not write to the same file
+    from .fast import excel_sheet_names
+
+    names = excel_sheet_names(fp)
+    fp.seek(0)
+    file_names = {}
+    used = set()
+    for name in names:
+        file_name = base = sheet_filename_re.sub('_', name)
+        i = 1
+        while file_name.lower() in used:
+            i += 1
+            file_name = '%s-%d' % (base, i)
+        used.add(file_name.lower())
+        file_names[name] = file_name
+    return file_names
+
+
+def split_in_one_file(options, ext):
+    return options.format == 'jsonl' or (options.format == 'parquet' and ext == '.xlsx')
+
+
+def output_filename(options, filename, is_unicode=False, sheet=None, script=None):
     if options.output:
         return options.output
 
     base, ext = os.path.splitext(filename)
     if options.directory:
-        make_outdir(options)
+        make_outdir(options, options.directory)
         base = os.path.basename(base)
         base = os.path.join(options.directory, base)
-    if options.split:
+    if sheet is not None:
+        base = base + '-' + sheet_filename_re.sub('_', sheet)
+    # a jsonl record or a parquet row holds both the ascii and unicode text
+    if options.split and not split_in_one_file(options, ext):
         if is_unicode:
             base = base + '-' + options.unicode
         else:
             base = base + '-' + options.ascii
+    if script is not None:
+        base = base + '-' + script
 
     # catch for Excel files
     out_ext = options.extension
-    if ext == '.xlsx' and out_ext == 'txt':
+    if options.format == 'jsonl' and out_ext == 'txt':
+        out_ext = 'jsonl'
+    elif options.format == 'parquet' and ext == '.xlsx' and out_ext == 'txt':
+        out_ext = 'parquet'
+    elif ext == '.xlsx' and out_ext == 'txt':
         out_ext = 'csv'
+    # Parquet files are compressed by pyarrow
+    if options.compress and out_ext != 'parquet':
+        out_ext += compressors[options.compress][2]
     return base + '.' + out_ext
 
 
@@ -299,6 +623,8 @@ def write_out_split(options, filename, text_runs):
         return
 
     outlines_ascii, outlines_unicode = split_ascii_unicode(options, text_runs)
+    if options.file_stats is not None:
+        lap(options.file_stats, 'split')
     ascii_name, unicode_name = output_filename_split(options, filename)
 
     write_text_runs(options, ascii_name, outlines_ascii)
@@ -311,70 +637,632 @@ def write_out(options, filename, text_runs):
 
     if options.split:
         write_out_split(options, filename, text_runs)
+    elif options.split_scripts:
+        from .scripts import write_out_scripts
+        write_out_scripts(options, filename, text_runs)
     else:
         write_text_runs(options, output_filename(options, filename), text_runs)
+    if options.file_stats is not None:
+        lap(options.file_stats, 'write')
 
 
-def write_csv_split(options, filename, text_runs):
-    if not text_runs:
-        return
+def write_csv_split(options, filename, rows, sheet=None):
+    ascii_name, unicode_name = output_filename_split(options, filename, sheet=sheet)
+    ascii_out = TextRunWriter(options, ascii_name, is_csv=True)
+    unicode_out = TextRunWriter(options, unicode_name, is_csv=True)
 
-    outlines_ascii, outlines_unicode = split_ascii_unicode_csv(options, text_runs)
-    ascii_name, unicode_name = output_filename_split(options, filename)
+    stats = options.file_stats
 
-    write_text_runs(options, ascii_name, outlines_ascii, is_csv=True)
-    write_text_runs(options, unicode_name, outlines_unicode, is_csv=True)
+    # split each row as it is read so the workbook is never held in memory
+    try:
+        for row in rows:
+            line_ascii, line_unicode = split_ascii_unicode_row(options, row)
+            if stats is not None:
+                lap(stats, 'split')
+            ascii_out.write(line_ascii)
+            unicode_out.write(line_unicode)
+    finally:
+        ascii_out.close()
+        unicode_out.close()
+
+
+def write_csv(options, filename, rows, sheet=None):
+    if options.split:
+        write_csv_split(options, filename, rows, sheet=sheet)
+    elif options.split_scripts:
+        from .scripts import write_csv_scripts
+        write_csv_scripts(options, filename, rows, sheet=sheet)
+    else:
+        write_text_runs(options, output_filename(options, filename, sheet=sheet), rows, is_csv=True)
 
 
-def write_csv(options, filename):
-    text_runs = excel(options, filename)
-    if text_runs:
-        if options.split:
-            write_csv_split(options, filename, text_runs)
-        else:
-            write_text_runs(options, output_filename(options, filename), text_runs, is_csv=True)
+def fast_word(options, filename):
+    from . import fast
+    return fast.word(options, filename)
 
 
-def off2txt_file(options, path):
-    if not check_file_access(options, path):
-        return
+def fast_powerpoint(options, filename):
+    from . import fast
+    return fast.powerpoint(options, filename)
 
-    base, ext = os.path.splitext(path)
-    ext_to_proc = {
+
+def fast_powerpoint_by_slide(options, filename):
+    from . import fast
+    return fast.powerpoint_by_slide(options, filename)
+
+
+def fast_excel(options, filename):
+    from . import fast
+    return fast.excel(options, filename)
+
+
+def fast_excel_sheets(options, filename, names=None):
+    from . import fast
+    return fast.excel_sheets(options, filename, names=names)
+
+
+# extraction functions for each engine by file extension
+engines = {
+    'library': {
         '.docx': word,
         '.pptx': powerpoint,
         '.xlsx': excel
+    },
+    'fast': {
+        '.docx': fast_word,
+        '.pptx': fast_powerpoint,
+        '.xlsx': fast_excel
     }
-    if ext not in ext_to_proc:
-        writerr('Unknown extension: %s' % ext)
+}
+
+
+# zip and tar archives of Office files, see archive.py
+archive_suffixes = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(path):
+    return path.lower().endswith(archive_suffixes)
+
+
+# PowerPoint extraction by slide for each engine
+slide_engines = {
+    'library': powerpoint_by_slide,
+    'fast': fast_powerpoint_by_slide
+}
+
+# Excel extraction by sheet for each engine
+sheet_engines = {
+    'library': excel_sheets,
+    'fast': fast_excel_sheets
+}
+
+
+def extract_sheets(options, path, fp, names):
+    # each sheet to its own file
+    stats = options.file_stats
+    file_names = sheet_file_names(fp)
+    for sheet, rows in sheet_engines[options.engine](options, fp, names=names):
+        if stats is not None:
+            rows = timed_text_runs(stats, rows)
+        write_csv(options, path, rows, sheet=file_names.get(sheet, sheet))
+
+
+def extract_file(options, path, ext, fp, sheet=None):
+    stats = options.file_stats
+    if stats is not None:
+        fp.seek(0, os.SEEK_END)
+        # the members of an archive add up
+        stats['bytes_in'] += fp.tell()
+        fp.seek(0)
+        lap(stats, 'open')
+
+    if options.format == 'jsonl':
+        from .jsonl import write_jsonl
+        write_jsonl(options, path, ext, fp, sheet=sheet)
+        return
+
+    # Word and PowerPoint files are still saved as text
+    if options.format == 'parquet' and ext == '.xlsx':
+        from .parquet import write_parquet
+        write_parquet(options, path, fp, sheet=sheet)
+        return
+
+    if ext == '.xlsx' and options.sheets:
+        extract_sheets(options, path, fp, None if sheet is None else [sheet])
         return
 
-    if ext in ('.docx', '.pptx'):
-        write_out(options, path, ext_to_proc[ext](options, path))
+    proc = engines[options.engine][ext]
+    if options.cache_dir:
+        from .cache import cached_text_runs
+        text_runs = cached_text_runs(options, fp, ext, proc)
     else:
-        write_csv(options, path)
+        text_runs = proc(options, fp)
 
+    if stats is not None:
+        if isinstance(text_runs, list):
+            lap(stats, 'parse')
+            stats['text_runs'] = len(text_runs)
+        else:
+            text_runs = timed_text_runs(stats, text_runs)
 
-def off2txt(options):
+    if ext == '.xlsx':
+        write_csv(options, path, text_runs)
+    else:
+        write_out(options, path, text_runs)
+
+
+def rollback_outputs(options, sizes):
+    # cut each output back to its size before the input, removing new files
+    for filename, size in sizes.items():
+        if options.output_pool is not None:
+            options.output_pool.discard(filename)
+        try:
+            if size:
+                with open(filename, 'r+b') as fp:
+                    fp.truncate(size)
+            else:
+                os.remove(filename)
+        except (IOError, OSError) as e:
+            writerr(options, 'Exception removing output file: %s' % filename, exception=e)
+
+
+def extract_file_limited(options, path, ext, fp, sheet=None):
+    from .limits import Guard, LimitExceeded, check_archive, writerr_limit
+
+    # a skipped file leaves nothing in its outputs
+    outputs = len(options.outputs) if options.outputs is not None else 0
+    deferred = len(options.deferred_writes) if options.deferred_writes is not None else 0
+    if options.output_pool is not None:
+        # a compressed stream can only be cut back to where it was ended
+        if options.compress:
+            options.output_pool.close()
+        else:
+            options.output_pool.flush()
+    options.output_sizes = {}
+    try:
+        with Guard(options):
+            if options.max_size or options.max_ratio:
+                check_archive(options, fp)
+            extract_file(options, path, ext, fp, sheet=sheet)
+    except LimitExceeded as e:
+        writerr_limit(options, 'Skipped file: %s: %s' % (path, e))
+        rollback_outputs(options, options.output_sizes)
+        if options.deferred_writes is not None:
+            for filename, spool in options.deferred_writes[deferred:]:
+                remove_spool(spool)
+            del options.deferred_writes[deferred:]
+        if options.outputs is not None:
+            del options.outputs[outputs:]
+        return False
+    finally:
+        options.output_sizes = None
+    return True
+
+
+def off2txt_file(options, path, sheet=None, data=None):
+    base, ext = os.path.splitext(path)
+    archive = is_archive(path)
+    if ext not in engines[options.engine] and not archive:
+        # a missing or unreadable file is reported as such, and -A still
+        # hides it, rather than as an unknown extension
+        if data is None and not check_file_access(options, path):
+            return False
+        writerr(options, 'Unknown extension: %s' % ext)
+        return False
+
+    # data is the file contents when it has already been read
+    if data is not None:
+        fp = io.BytesIO(data)
+        fp.name = path
+    else:
+        fp = open_input(options, path)
+        if fp is None:
+            return False
+
+    # rows may be streamed from the file so it stays open until they are written
+    with fp:
+        if archive:
+            from .archive import extract_archive
+            return extract_archive(options, path, fp)
+        if options.limits:
+            return extract_file_limited(options, path, ext, fp, sheet=sheet)
+        extract_file(options, path, ext, fp, sheet=sheet)
+    return True
+
+
+def directory_entries(path):
+    # (path, name, is_dir) for each entry of path, symlinks to directories are
+    # not followed; Python 2 has no os.scandir
+    entries = []
+    if not hasattr(os, 'scandir'):
+        for name in os.listdir(path):
+            p = os.path.join(path, name)
+            entries.append((p, name, os.path.isdir(p) and not os.path.islink(p)))
+        return entries
+
+    for entry in os.scandir(path):
+        try:
+            entries.append((entry.path, entry.name, entry.is_dir(follow_symlinks=False)))
+        except OSError as e:
+            error('directory_entries: exception for %s: %s' % (entry.path, e), exc_info=True)
+    return entries
+
+
+def walk_directory(options, top):
+    # stream the files under top, one directory listing in memory at a time
+    extensions = engines[options.engine]
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = directory_entries(path)
+        except OSError as e:
+            writerr_file_access(options, 'Directory is not readable: %s' % path)
+            error('walk_directory: exception for %s: %s' % (path, e), exc_info=True)
+            continue
+
+        files = []
+        dirs = []
+        for entry_path, name, is_dir in entries:
+            if is_dir:
+                dirs.append(entry_path)
+            elif (os.path.splitext(name)[1] in extensions or is_archive(name)) and not name.startswith('~$'):
+                # ~$ files are Office lock files
+                files.append(entry_path)
+
+        for f in sorted(files):
+            yield f
+        stack.extend(sorted(dirs, reverse=True))
+
+
+def chunk_reader(fp):
+    # a read that returns what is available rather than waiting for a full
+    # chunk, so names from a pipe are extracted as they arrive
+    if hasattr(fp, 'read1'):
+        return fp.read1
+    try:
+        fd = fp.fileno()
+    except (AttributeError, io.UnsupportedOperation, ValueError):
+        return fp.read
+    # a Python 2 file
+    return lambda size: os.read(fd, size)
+
+
+def read_null_separated(fp):
+    # stream NUL separated names without reading the whole input
+    read = chunk_reader(fp)
+    pending = None
+    while True:
+        data = read(64 * 1024)
+        if not data:
+            break
+        if pending:
+            data = pending + data
+        names = data.split(b'\0' if isinstance(data, bytes) else u'\0')
+        pending = names.pop()
+        for name in names:
+            if name:
+                yield name
+    if pending:
+        yield pending
+
+
+def files_from(options):
+    if options.files_from == stdout_name:
+        fp = getattr(options.stdin, 'buffer', options.stdin)
+        for name in read_null_separated(fp):
+            yield name
+        return
+
+    with open(options.files_from, 'rb') as fp:
+        for name in read_null_separated(fp):
+            yield name
+
+
+def input_names(options):
     for f in options.files:
-        off2txt_file(options, f)
+        yield f
 
+    if options.files_from:
+        for name in files_from(options):
+            if isinstance(name, bytes):
+                name = fsdecode(name)
+            yield name
 
-def main(argv, stdin=None, stdout=None, stderr=None):
-    from .options import parse_opts
-    exit_statuses = {
-        'extracted': 0,
-        'no-extract': 1,
-        'error': 2,
-        'not-set': -1
-    }
 
-    options = parse_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
-    if not options:
-        return exit_statuses['error']
+def input_files(options):
+    for f in input_names(options):
+        if options.recursive and os.path.isdir(f):
+            for path in walk_directory(options, f):
+                yield path
+        else:
+            yield f
+
+
+def pending_files(options):
+    # inputs to extract from, skipping those the manifest says are unchanged
+    for path in input_files(options):
+        st = None
+        if options.manifest_db is not None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                pass
+            else:
+                from .manifest import manifest_unchanged
+                outputs = manifest_unchanged(options, path, st)
+                if outputs is not None:
+                    if outputs:
+                        options.did_extract = True
+                    continue
+        yield path, st
+
+
+def begin_file(options):
+    options.outputs = []
+    exit_status = options.exit_status
+    options.exit_status = 'not-set'
+    return exit_status
+
+
+def end_file(options, path, st, extracted, exit_status):
+    # an error outranks a file skipped for a limit, which outranks success
+    failed = options.exit_status == 'error'
+    limited = options.exit_status == 'limit' and exit_status != 'error'
+    if not failed and not limited:
+        options.exit_status = exit_status
+
+    if extracted and not failed and st is not None:
+        from .manifest import manifest_record
+        manifest_record(options, path, st, options.outputs)
+    if options.run_outputs is not None:
+        options.run_outputs.extend(options.outputs)
+    options.outputs = None
+
+
+# files per worker handed to the pool at a time
+parallel_batch_size = 32
+
+
+def off2txt_file_worker(item):
+    shared, path, st, sheet, data = item
+    # a server's workers were started in the server's directory, not the client's
+    if os.getcwd() != shared.cwd:
+        os.chdir(shared.cwd)
+    options = copy.copy(shared)
+    options.stderr = StringIO()
+    options.exit_status = 'not-set'
+    options.deferred_writes = []
+    # parquet files are written here rather than deferred
+    options.outputs = []
+    options.cache_hits = options.cache_misses = 0
+    extracted = False
+    file_stats = None
+    if options.stats:
+        begin_file_stats(options, path)
+    try:
+        extracted = off2txt_file(options, path, sheet=sheet, data=data)
+    except Exception as e:
+        writerr(options, 'Exception extracting from file: %s' % path, exception=e)
+    if options.stats:
+        file_stats = end_file_stats(options)
+        if sheet is not None:
+            file_stats['sheet'] = sheet
+    return path, st, extracted, options.deferred_writes, options.outputs, options.stderr.getvalue(), options.exit_status, options.cache_hits, options.cache_misses, file_stats
+
+
+def workbook_sheets(options, path, data=None):
+    # sheet names to hand to the workers one by one, None for the whole file
+    if not options.sheets or os.path.splitext(path)[1] != '.xlsx':
+        return [None]
+    try:
+        from .fast import excel_sheet_names
+        names = excel_sheet_names(path if data is None else io.BytesIO(data))
+    except Exception as e:
+        # the worker reports the file
+        error('workbook_sheets: exception for %s: %s' % (path, e), exc_info=True)
+        return [None]
+    if len(names) < 2:
+        return [None]
+    return names
+
+
+def parallel_tasks(options, shared):
+    # (task, first, last) with the sheets of a workbook as separate tasks when
+    # saving sheets to their own files
+    for path, st in pending_files(options):
+        sheets = workbook_sheets(options, path)
+        for i, sheet in enumerate(sheets):
+            yield (shared, path, st, sheet, None), i == 0, i == len(sheets) - 1
+
+
+def shared_options(options):
+    # file objects, the manifest connection and the pool cannot be sent to the workers
+    shared = copy.copy(options)
+    shared.stdin = shared.stdout = shared.stderr = None
+    shared.manifest_db = None
+    shared.pool = None
+    shared.output_pool = None
+    shared.run_stats = None
+    # every task carries the shared options, so nothing that grows with the
+    # number of inputs goes with them
+    shared.files = None
+    shared.made_dirs = set()
+    shared.outputs = None
+    shared.run_outputs = None
+    shared.deferred_writes = None
+    shared.output_sizes = None
+    # relative paths are for the directory the run was started in
+    shared.cwd = os.getcwd()
+    return shared
+
+
+class WorkerResults(object):
+    # handles worker results in input order; the sheets of a workbook come
+    # back as separate results and are recorded as one input
+
+    def __init__(self, options):
+        self.options = options
+        self.saved_exit_status = None
+        self.all_extracted = False
+
+    def start(self, result, first):
+        # returns the writes to replay
+        options = self.options
+        path, st, extracted, writes, outputs, errors, exit_status, cache_hits, cache_misses, file_stats = result
+        if first:
+            self.saved_exit_status = begin_file(options)
+            self.all_extracted = True
+        if outputs:
+            options.did_extract = True
+            options.outputs.extend(outputs)
+        self.all_extracted = self.all_extracted and extracted
+        if errors:
+            options.stderr.write(errors)
+        if exit_status == 'error' or (exit_status == 'limit' and options.exit_status == 'not-set'):
+            options.exit_status = exit_status
+        options.cache_hits += cache_hits
+        options.cache_misses += cache_misses
+        if file_stats is not None:
+            add_file_stats(options, file_stats)
+        return writes
+
+    def finish(self, result, last):
+        if last:
+            path, st = result[:2]
+            end_file(self.options, path, st, self.all_extracted, self.saved_exit_status)
+
+
+def replay_writes(options, writes, file_stats=None):
+    # the worker's write time was that of writing its temp files, the time of
+    # appending them to the outputs is added here
+    if file_stats is not None:
+        start = timer()
+    for filename, spool in writes:
+        out = TextRunWriter(options, filename)
+        try:
+            out.write_spool(spool)
+        finally:
+            out.close()
+            remove_spool(spool)
+    if file_stats is not None:
+        elapsed = timer() - start
+        file_stats['phases']['write'] += elapsed
+        file_stats['seconds'] += elapsed
+
+
+def off2txt_parallel(options):
+    import multiprocessing
+
+    shared = shared_options(options)
+
+    # inputs are handed to the pool in batches so a directory walk is never
+    # read far ahead of the workers and the manifest is only used from here
+    tasks = parallel_tasks(options, shared)
+    batch_size = options.jobs * parallel_batch_size
+
+    # a server keeps one pool running for all of its requests
+    pool = options.pool
+    if pool is None:
+        pool = multiprocessing.Pool(processes=options.jobs)
+    handler = WorkerResults(options)
+    try:
+        while True:
+            batch = list(itertools.islice(tasks, batch_size))
+            if not batch:
+                break
+
+            # imap returns results in input order so output files are appended deterministically
+            results = pool.imap(off2txt_file_worker, [task for task, first, last in batch])
+            for (task, first, last), result in zip(batch, results):
+                replay_writes(options, handler.start(result, first), result[-1])
+                handler.finish(result, last)
+    except BaseException:
+        if options.pool is None:
+            pool.terminate()
+            pool.join()
+        raise
+
+    if options.pool is None:
+        pool.close()
+        pool.join()
+
+
+def off2txt_serial(options):
+    for path, st in pending_files(options):
+        exit_status = begin_file(options)
+        if options.stats:
+            begin_file_stats(options, path)
+        extracted = False
+        try:
+            extracted = off2txt_file(options, path)
+        finally:
+            if options.stats:
+                add_file_stats(options, end_file_stats(options))
+            end_file(options, path, st, extracted, exit_status)
 
-    init_logging(options)
 
+def off2txt(options):
+    if options.files_from and options.files_from != stdout_name and not check_file_access(options, options.files_from):
+        options.exit_status = 'error'
+        return
+
+    if options.manifest:
+        from .manifest import close_manifest, open_manifest
+        try:
+            open_manifest(options)
+        except Exception as e:
+            writerr(options, 'Exception opening manifest: %s' % options.manifest, exception=e)
+            return
+
+    if options.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            writerr(options, 'pyarrow is needed for --format parquet: pip install pyarrow')
+            return
+
+    if options.stats:
+        start_stats(options)
+
+    options.output_pool = OutputPool(options)
+    try:
+        if options.prefetch:
+            from .pipeline import off2txt_pipeline
+            off2txt_pipeline(options)
+        elif options.jobs > 1:
+            off2txt_parallel(options)
+        else:
+            off2txt_serial(options)
+    finally:
+        # outputs are complete before the manifest records them as done
+        options.output_pool.close()
+        options.output_pool = None
+        if options.manifest_db is not None:
+            close_manifest(options)
+
+    if options.cache_dir:
+        from .cache import prune_cache
+        evicted = prune_cache(options)
+        options.stderr.write('Cache: %d hits, %d misses, %d evicted\n' % (options.cache_hits, options.cache_misses, evicted))
+
+    if options.run_stats is not None:
+        try:
+            write_stats(options)
+        except Exception as e:
+            writerr(options, 'Exception writing stats file: %s' % options.stats, exception=e)
+
+
+exit_statuses = {
+    'extracted': 0,
+    'no-extract': 1,
+    'error': 2,
+    'limit': 3,
+    'not-set': -1
+}
+
+
+def run_options(options):
     # do the extractions
     try:
         off2txt(options)
@@ -393,6 +1281,26 @@ def main(argv, stdin=None, stdout=None, stderr=None):
     return exit_statuses[options.exit_status]
 
 
+def main(argv, stdin=None, stdout=None, stderr=None):
+    from .options import parse_opts
+
+    options = parse_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    if not options:
+        return exit_statuses['error']
+
+    if options.connect:
+        from .server import connect
+        return connect(options, argv)
+
+    init_logging(options)
+
+    if options.serve:
+        from .server import serve
+        return serve(options)
+
+    return run_options(options)
+
+
 def run():
     sys.exit(main(sys.argv[1:]))
 
@@ -2,6 +2,9 @@
 from __future__ import print_function
 
 import argparse
+import multiprocessing
+import os
+import signal
 import sys
 
 from . import __version__
@@ -44,6 +47,39 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
         help='Save debug logging to FILE.'
     )
 
+    parser.add_argument(
+        '--format',
+        choices=['text', 'jsonl', 'parquet'],
+        default='text',
+        help='Output format. text saves Word and PowerPoint text to txt files and Excel to csv files. jsonl saves one JSON record per paragraph or row with the source file, sheet, slide, paragraph or row number and, with the -s option, ascii and unicode fields in place of text. Use -o to write a whole batch to one file or to standard output. parquet saves each Excel sheet to its own Parquet file with a typed column per sheet column, or an ascii and unicode column pair with the -s option, and saves Word and PowerPoint text as text; it needs pyarrow. The cache is not used with jsonl or parquet. Default %(default)s.'
+    )
+
+    parser.add_argument(
+        '--compress',
+        choices=['gzip', 'bz2', 'xz'],
+        help='Compress output files as they are written and add the .gz, .bz2 or .xz suffix to their names. The suffix is not added to a file given with -o. Output files that are appended to get another compressed stream, which is read back as one file. To compress standard output, pipe it through the compressor instead. Parquet files are not affected.'
+    )
+
+    parser.add_argument(
+        '--compress-level',
+        metavar='N',
+        type=int,
+        help='Compression level for --compress, 1 to 9 for gzip and bz2 and 0 to 9 for xz. Higher levels are smaller and slower. Default is the level of the compressor: 9 for gzip and bz2 and 6 for xz.'
+    )
+
+    parser.add_argument(
+        '--csv-dialect',
+        choices=['plain', 'excel', 'excel-tab', 'unix'],
+        default='plain',
+        help='Format of the csv files saved from Excel. plain separates cells with a comma and a space and does not quote them. excel, excel-tab and unix are written with the csv module, which quotes cells holding the delimiter, quotes or line breaks; excel and excel-tab end rows with CRLF and unix with LF. Default %(default)s.'
+    )
+
+    parser.add_argument(
+        '--csv-delimiter',
+        metavar='CHAR',
+        help='Separate cells with CHAR in place of the delimiter of the --csv-dialect. Not allowed with the plain dialect.'
+    )
+
     parser.add_argument(
         '-a',
         '--ascii',
@@ -66,11 +102,132 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
         help='Extension to use for extracted text files. Default for Word and PowerPoint is %(default)s. Default for Excel is csv.'
     )
 
+    parser.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        metavar='DIRECTORY',
+        help='Cache extracted text in DIRECTORY. Files whose contents have not changed since they were cached are not parsed again.'
+    )
+
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        default=1024,
+        type=int,
+        metavar='MB',
+        help='Maximum size of the cache in megabytes. Least recently used entries are removed at the end of a run to keep within the limit. Default %(default)s.'
+    )
+
+    parser.add_argument(
+        '--serve',
+        metavar='SOCKET',
+        help='Run as a server listening for extraction requests on the Unix domain socket SOCKET. The Office libraries are loaded once and, with the -j option, the worker pool is kept running between requests.'
+    )
+
+    parser.add_argument(
+        '--connect',
+        metavar='SOCKET',
+        help='Send the extraction to the server listening on SOCKET instead of running it in this process.'
+    )
+
+    parser.add_argument(
+        '--engine',
+        default='library',
+        choices=['library', 'fast'],
+        help='Extraction engine. library uses python-docx, python-pptx and openpyxl. fast reads the document XML directly and is quicker for plain text. Default %(default)s.'
+    )
+
+    parser.add_argument(
+        '--files-from',
+        dest='files_from',
+        metavar='FILE',
+        help='Also extract from the files named in FILE, separated by NUL characters as written by find -print0. Use - to read the names from standard input, except with --connect. Names are read as they are needed.'
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        default=1,
+        type=int,
+        metavar='N',
+        help='Extract from N files in parallel using a pool of worker processes. Use 0 for one worker per CPU. Default %(default)s.'
+    )
+
     parser.add_argument(
         '-o',
         '--output',
         metavar='FILE',
-        help='Save extracted text to FILE. If not given, the output file is named the same as the input file but with a txt extension. The extension can be changed with the -e option. Files are opened in append mode unless the -X option is given.'
+        help='Save extracted text to FILE. Use - to write to standard output. If not given, the output file is named the same as the input file but with a txt extension. The extension can be changed with the -e option. Files are opened in append mode unless the -X option is given.'
+    )
+
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Read up to N files ahead on background threads while earlier files are parsed in worker processes and written on another thread. Helps when files are on slow network storage. Needs Python 3.5 or later. Default 0, off.'
+    )
+
+    parser.add_argument(
+        '-r',
+        '--recursive',
+        default=False,
+        action='store_true',
+        help='Extract from the Word, PowerPoint and Excel files, and the zip and tar archives of them, in directories and their subdirectories.'
+    )
+
+    parser.add_argument(
+        '--manifest',
+        metavar='FILE',
+        help='Record the size and modification time of each extracted file in FILE and skip files that are unchanged since a run with the same output options. Files are never skipped when -o and -X are given together.'
+    )
+
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=0,
+        metavar='SECONDS',
+        help='Skip a file that takes longer than SECONDS to extract. Default no limit.'
+    )
+
+    parser.add_argument(
+        '--max-memory',
+        dest='max_memory',
+        type=int,
+        default=0,
+        metavar='MB',
+        help='Skip a file if the resident memory of the process extracting it goes over MB megabytes. Needs /proc, as on Linux. Default no limit.'
+    )
+
+    parser.add_argument(
+        '--max-size',
+        dest='max_size',
+        type=int,
+        default=0,
+        metavar='MB',
+        help='Skip a file that would decompress to more than MB megabytes. Checked before the file is parsed. Default no limit.'
+    )
+
+    parser.add_argument(
+        '--max-ratio',
+        dest='max_ratio',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Skip a file that would decompress to more than N times its compressed size. Checked before the file is parsed. Default no limit.'
+    )
+
+    parser.add_argument(
+        '--stats',
+        metavar='FILE',
+        help='Save the time spent opening, parsing, splitting and writing each file, with bytes in and out, text runs and peak memory, to FILE as JSON. A summary is printed to stderr. Memory is traced with tracemalloc, which slows extraction.'
+    )
+
+    parser.add_argument(
+        '--sheets',
+        default=False,
+        action='store_true',
+        help='Save each Excel sheet to its own file, named by adding -SHEET before the file extension. With the -j option the sheets of a workbook are extracted in parallel. The cache is not used for Excel files.'
     )
 
     parser.add_argument(
@@ -81,6 +238,13 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
         help='Split ASCII and Unicode text into two separate files. Unicode files are named by adding -unicode before the file extension. The Unicode identifer can be changed with the -u option.'
     )
 
+    parser.add_argument(
+        '--split-scripts',
+        default=False,
+        action='store_true',
+        help='Split text by script into a file for each script found, named by adding the script before the file extension, e.g. -latin, -han, -cyrillic, -arabic or -kana. Spaces, digits and punctuation stay with the text next to them; lines with no letters are saved with -common. Excel rows are saved to the file of each script in them, with numbers in every one. Not allowed with -s, jsonl or parquet.'
+    )
+
     parser.add_argument(
         '-u',
         '--unicode',
@@ -102,19 +266,69 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
         '--overwrite-output-files',
         default=False,
         action='store_true',
-        help='Truncate output files before writing.'
+        help='Truncate output files before the first write of a run.'
     )
 
     parser.add_argument(
         'files',
         metavar='File',
-        nargs='+',
-        help='Files to extract from'
+        nargs='*',
+        help='Files to extract from. The Office files in zip and tar archives (.zip, .tar, .tar.gz, .tgz, .tar.bz2, .tbz2, .tar.xz and .txz) are extracted without unpacking the archive, with outputs named as though it had been unpacked where it is.'
     )
 
     # print('argv = %s' % argv)
     options = parser.parse_args(argv)
 
+    if not options.files and not options.files_from and not options.serve:
+        parser.error('the following arguments are required: File')
+    if options.serve and options.connect:
+        parser.error('argument --connect: not allowed with argument --serve')
+    if options.connect and options.files_from == '-':
+        parser.error('argument --files-from: reading names from standard input not allowed with --connect')
+
+    if options.format == 'parquet' and options.output:
+        parser.error('argument -o/--output: not allowed with --format parquet')
+
+    if options.split_scripts and options.split:
+        parser.error('argument --split-scripts: not allowed with argument -s/--split')
+    if options.split_scripts and options.format != 'text':
+        parser.error('argument --split-scripts: not allowed with --format %s' % options.format)
+    if options.csv_delimiter is not None:
+        if options.csv_dialect == 'plain':
+            parser.error('argument --csv-delimiter: not allowed with the plain --csv-dialect')
+        if len(options.csv_delimiter) != 1:
+            parser.error('argument --csv-delimiter: must be one character')
+    if options.compress and options.output == '-':
+        parser.error('argument --compress: not allowed when writing to standard output')
+    if options.compress_level is not None:
+        if not options.compress:
+            parser.error('argument --compress-level: requires --compress')
+        lowest = 0 if options.compress == 'xz' else 1
+        if not lowest <= options.compress_level <= 9:
+            parser.error('argument --compress-level: must be %d to 9 for %s' % (lowest, options.compress))
+
+    if options.jobs < 0:
+        parser.error('argument -j/--jobs: must be 0 or more')
+    if options.jobs == 0:
+        # os.cpu_count is not in Python 2
+        try:
+            options.jobs = multiprocessing.cpu_count()
+        except NotImplementedError:
+            options.jobs = 1
+
+    for name in ('prefetch', 'timeout', 'max_memory', 'max_size', 'max_ratio'):
+        if getattr(options, name) < 0:
+            parser.error('argument --%s: must be 0 or more' % name.replace('_', '-'))
+    if options.prefetch and sys.version_info < (3, 5):
+        # the pipeline is written with async and await
+        parser.error('argument --prefetch: needs Python 3.5 or later')
+    if (options.timeout or options.max_memory) and not hasattr(signal, 'setitimer'):
+        parser.error('--timeout and --max-memory are not supported on this platform')
+    if options.max_memory and not os.path.exists('/proc/self/statm'):
+        # getrusage only has the peak, which would skip every file after the first big one
+        parser.error('argument --max-memory: not supported on this platform')
+    options.limits = bool(options.timeout or options.max_memory or options.max_size or options.max_ratio)
+
     # set up i/o options
     options.stdin = stdin or sys.stdin
     options.stdout = stdout or sys.stdout
@@ -123,5 +337,26 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
     options.did_extract = False
     options.exit_status = 'not-set'
 
+    options.cache_hits = 0
+    options.cache_misses = 0
+
+    # set in worker processes to collect writes for the parent
+    options.deferred_writes = None
+
+    # output files written for the current input, kept for the manifest
+    options.outputs = None
+    options.manifest_db = None
+
+    # set when running in a server
+    options.pool = None
+    options.output_pool = None
+
+    # sizes of the outputs before the current input, while limits are checked
+    options.output_sizes = None
+    options.made_dirs = set()
+    options.file_stats = None
+    options.run_stats = None
+    options.run_outputs = None
+
     return options
 
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# off2txt: Parquet output for Excel with --format parquet
+# each sheet is written to its own file with a typed column per sheet column,
+# or an ascii and unicode column pair when splitting; rows are streamed in
+# batches so a sheet is never held in memory
+#
+# column types come from the first batch of rows, which is written straight
+# away: a column with mixed or no values there is string, and a later value
+# that does not fit its column's type, or a column that starts after it, is
+# left empty and reported as an error
+import collections
+import os
+
+from .off2txt import output_filename, sheet_engines, sheet_file_names, split_ascii_unicode_row, writerr
+from .stats import timed_text_runs
+
+
+# rows per Parquet row group
+batch_size = 10000
+
+
+def column_names(options, width):
+    from openpyxl.utils import get_column_letter
+
+    names = []
+    for i in range(1, width + 1):
+        letter = get_column_letter(i)
+        if options.split:
+            names.append(letter + '-' + options.ascii)
+            names.append(letter + '-' + options.unicode)
+        else:
+            names.append(letter)
+    return names
+
+
+def string_array(pa, values):
+    return pa.array([None if v is None else u'%s' % v for v in values], type=pa.string())
+
+
+def column_array(pa, values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+        # mixed types within the batch
+        return string_array(pa, values)
+
+
+def column_type(pa, array):
+    # a column that is empty in the first batch takes text
+    if pa.types.is_null(array.type):
+        return pa.string()
+    return array.type
+
+
+def fits(pa, from_type, to_type):
+    if from_type == to_type or pa.types.is_null(from_type):
+        return True
+    return pa.types.is_integer(from_type) and pa.types.is_floating(to_type)
+
+
+def fit_column(pa, values, to_type):
+    # values as an array of to_type and the number of them left empty as
+    # they do not fit it
+    if pa.types.is_string(to_type):
+        return string_array(pa, values), 0
+    array = column_array(pa, values)
+    if fits(pa, array.type, to_type):
+        return array.cast(to_type), 0
+
+    fitted = []
+    dropped = 0
+    for v in values:
+        if v is not None and not fits(pa, column_array(pa, [v]).type, to_type):
+            v = None
+            dropped += 1
+        fitted.append(v)
+    return pa.array(fitted, type=to_type), dropped
+
+
+class SheetWriter(object):
+    # writes the rows of one sheet to a Parquet file in batches
+
+    def __init__(self, options, filename):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.options = options
+        self.filename = filename
+        self.rows = []
+        self.width = 0
+        self.schema = None
+        self.writer = None
+        # column name to the number of values left empty
+        self.dropped = collections.OrderedDict()
+
+    def write(self, row):
+        if self.options.split:
+            line_ascii, line_unicode = split_ascii_unicode_row(self.options, row)
+            row = [c for pair in zip(line_ascii, line_unicode) for c in pair]
+        self.rows.append(row)
+        self.width = max(self.width, len(row))
+        if len(self.rows) >= batch_size:
+            self.flush()
+
+    def drop(self, name, count):
+        if count:
+            self.dropped[name] = self.dropped.get(name, 0) + count
+
+    def table(self):
+        pa = self.pa
+        names = column_names(self.options, self.width // 2 if self.options.split else self.width)
+        columns = [[] for n in names]
+        for row in self.rows:
+            for i, column in enumerate(columns):
+                column.append(row[i] if i < len(row) else None)
+
+        if self.schema is None:
+            arrays = [column_array(pa, column) for column in columns]
+            self.schema = pa.schema([pa.field(n, column_type(pa, a)) for n, a in zip(names, arrays)])
+            arrays = [a.cast(f.type) for a, f in zip(arrays, self.schema)]
+        else:
+            arrays = []
+            for i, field in enumerate(self.schema):
+                array, dropped = fit_column(pa, columns[i] if i < len(columns) else [None] * len(self.rows), field.type)
+                self.drop(field.name, dropped)
+                arrays.append(array)
+            # columns that start after the first batch have no place in the file
+            for name, column in zip(names[len(self.schema):], columns[len(self.schema):]):
+                self.drop(name, sum(1 for v in column if v is not None))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.table()
+        self.rows = []
+        if self.writer is None:
+            self.options.did_extract = True
+            if self.options.outputs is not None:
+                self.options.outputs.append(self.filename)
+            self.writer = self.pq.ParquetWriter(self.filename, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+                if self.options.file_stats is not None:
+                    self.options.file_stats['bytes_out'] += os.path.getsize(self.filename)
+            if self.dropped:
+                columns = ', '.join('%s: %d' % (n, c) for n, c in self.dropped.items())
+                writerr(self.options, 'Values left empty as they do not fit the column type: %s: %s' % (self.filename, columns))
+                self.dropped.clear()
+
+
+def write_parquet(options, path, fp, sheet=None):
+    names = None if sheet is None else [sheet]
+    stats = options.file_stats
+    file_names = sheet_file_names(fp)
+    for name, rows in sheet_engines[options.engine](options, fp, names=names):
+        if stats is not None:
+            rows = timed_text_runs(stats, rows)
+
+        out = SheetWriter(options, output_filename(options, path, sheet=file_names.get(name, name)))
+        try:
+            for row in rows:
+                # rows without a value are left out, unlike the csv output
+                # which writes them as empty cells
+                if any(cell is not None for cell in row):
+                    out.write(row)
+        except BaseException:
+            out.close()
+            # a partly written sheet is not left behind
+            if os.path.exists(out.filename):
+                os.remove(out.filename)
+            raise
+        out.close()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# off2txt: pipelined extraction for --prefetch
+# inputs are read ahead on I/O threads, parsed in worker processes and written
+# on a writer thread, so reading, parsing and writing different files overlap
+#
+# bounded queues between the stages hold back the reader when the parser or
+# the writer falls behind, so at most prefetch + 2 * jobs files are in memory
+import asyncio
+import multiprocessing
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+
+from .off2txt import WorkerResults, engines, is_archive, off2txt_file_worker, pending_files, replay_writes, shared_options, workbook_sheets
+
+
+def read_input(options, path):
+    # None lets the worker open the file itself and report any error; archives
+    # can be large and are read by the worker a member at a time
+    if os.path.splitext(path)[1] not in engines[options.engine] or is_archive(path):
+        return None
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read()
+    except (IOError, OSError):
+        return None
+
+
+def pool_future(loop, pool, func, arg):
+    # a multiprocessing pool task as an asyncio future
+    future = loop.create_future()
+
+    def done(result):
+        loop.call_soon_threadsafe(future.set_result, result)
+
+    def failed(e):
+        loop.call_soon_threadsafe(future.set_exception, e)
+
+    pool.apply_async(func, (arg, ), callback=done, error_callback=failed)
+    return future
+
+
+async def read_stage(options, loop, readers, queue):
+    # walking directories and checking the manifest block, so the next
+    # input is found on a reader thread too
+    inputs = pending_files(options)
+    while True:
+        item = await loop.run_in_executor(readers, next, inputs, None)
+        if item is None:
+            break
+        path, st = item
+        data = loop.run_in_executor(readers, read_input, options, path)
+        await queue.put((path, st, data))
+    await queue.put(None)
+
+
+async def parse_stage(options, loop, pool, read_queue, parse_queue):
+    shared = shared_options(options)
+    while True:
+        item = await read_queue.get()
+        if item is None:
+            break
+        path, st, data = item
+        data = await data
+
+        # each sheet of a workbook is a separate task with --sheets; rather
+        # than send every task a copy of the workbook each worker reads it
+        sheets = workbook_sheets(options, path, data)
+        if len(sheets) > 1:
+            data = None
+        for i, sheet in enumerate(sheets):
+            result = pool_future(loop, pool, off2txt_file_worker, (shared, path, st, sheet, data))
+            await parse_queue.put((result, i == 0, i == len(sheets) - 1))
+    await parse_queue.put(None)
+
+
+async def write_stage(options, loop, writer, queue):
+    # results are written in input order
+    handler = WorkerResults(options)
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        result, first, last = item
+        result = await result
+        writes = handler.start(result, first)
+        await loop.run_in_executor(writer, replay_writes, options, writes, result[-1])
+        # the manifest is only written from this thread
+        handler.finish(result, last)
+
+
+async def run_pipeline(options, loop, pool, readers, writer):
+    read_queue = asyncio.Queue(maxsize=options.prefetch)
+    parse_queue = asyncio.Queue(maxsize=options.jobs * 2)
+    stages = [
+        loop.create_task(read_stage(options, loop, readers, read_queue)),
+        loop.create_task(parse_stage(options, loop, pool, read_queue, parse_queue)),
+        loop.create_task(write_stage(options, loop, writer, parse_queue)),
+    ]
+    try:
+        await asyncio.gather(*stages)
+    except BaseException:
+        for stage in stages:
+            stage.cancel()
+        raise
+
+
+def off2txt_pipeline(options):
+    # a server keeps one pool running for all of its requests
+    pool = options.pool
+    if pool is None:
+        pool = multiprocessing.Pool(processes=options.jobs)
+    readers = ThreadPoolExecutor(max_workers=options.prefetch)
+    writer = ThreadPoolExecutor(max_workers=1)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run_pipeline(options, loop, pool, readers, writer))
+    except BaseException:
+        if options.pool is None:
+            pool.terminate()
+            pool.join()
+        raise
+    finally:
+        readers.shutdown(wait=True)
+        writer.shutdown(wait=True)
+        loop.close()
+
+    if options.pool is None:
+        pool.close()
+        pool.join()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# off2txt: splitting text by script for --split-scripts
+# each line is split into runs of one script (latin, han, cyrillic, ...) and
+# each script is saved to its own file in one pass over the text
+#
+# characters are classified with a sorted table of code point ranges: the
+# script of a code point is found once with bisect and then kept in a lookup
+# table that str.translate uses, so a line is mapped to its scripts in C
+import bisect
+import collections
+import re
+
+from .off2txt import TextRunWriter, is_astring, output_filename, write_text_runs
+from .stats import lap
+
+
+# spaces, digits, punctuation, symbols and combining marks join the run next to them
+common = 'common'
+
+# code points not in the table
+other = 'other'
+
+# (first, last, script), sorted and not overlapping
+script_ranges = (
+    (0x0000, 0x0040, common),
+    (0x0041, 0x005a, 'latin'),
+    (0x005b, 0x0060, common),
+    (0x0061, 0x007a, 'latin'),
+    (0x007b, 0x00bf, common),
+    (0x00c0, 0x00d6, 'latin'),
+    (0x00d7, 0x00d7, common),
+    (0x00d8, 0x00f6, 'latin'),
+    (0x00f7, 0x00f7, common),
+    (0x00f8, 0x02af, 'latin'),
+    (0x02b0, 0x036f, common),
+    (0x0370, 0x03ff, 'greek'),
+    (0x0400, 0x052f, 'cyrillic'),
+    (0x0530, 0x058f, 'armenian'),
+    (0x0590, 0x05ff, 'hebrew'),
+    (0x0600, 0x06ff, 'arabic'),
+    (0x0700, 0x074f, 'syriac'),
+    (0x0750, 0x077f, 'arabic'),
+    (0x0780, 0x07bf, 'thaana'),
+    (0x08a0, 0x08ff, 'arabic'),
+    (0x0900, 0x097f, 'devanagari'),
+    (0x0980, 0x09ff, 'bengali'),
+    (0x0a00, 0x0a7f, 'gurmukhi'),
+    (0x0a80, 0x0aff, 'gujarati'),
+    (0x0b00, 0x0b7f, 'oriya'),
+    (0x0b80, 0x0bff, 'tamil'),
+    (0x0c00, 0x0c7f, 'telugu'),
+    (0x0c80, 0x0cff, 'kannada'),
+    (0x0d00, 0x0d7f, 'malayalam'),
+    (0x0d80, 0x0dff, 'sinhala'),
+    (0x0e00, 0x0e7f, 'thai'),
+    (0x0e80, 0x0eff, 'lao'),
+    (0x0f00, 0x0fff, 'tibetan'),
+    (0x1000, 0x109f, 'myanmar'),
+    (0x10a0, 0x10ff, 'georgian'),
+    (0x1100, 0x11ff, 'hangul'),
+    (0x1200, 0x139f, 'ethiopic'),
+    (0x13a0, 0x13ff, 'cherokee'),
+    (0x1780, 0x17ff, 'khmer'),
+    (0x1800, 0x18af, 'mongolian'),
+    (0x1ab0, 0x1aff, common),
+    (0x1c80, 0x1c8f, 'cyrillic'),
+    (0x1c90, 0x1cbf, 'georgian'),
+    (0x1d00, 0x1dbf, 'latin'),
+    (0x1dc0, 0x1dff, common),
+    (0x1e00, 0x1eff, 'latin'),
+    (0x1f00, 0x1fff, 'greek'),
+    (0x2000, 0x2bff, common),
+    (0x2c60, 0x2c7f, 'latin'),
+    (0x2d00, 0x2d2f, 'georgian'),
+    (0x2de0, 0x2dff, 'cyrillic'),
+    (0x2e00, 0x2e7f, common),
+    (0x2e80, 0x2fdf, 'han'),
+    (0x3000, 0x303f, common),
+    (0x3040, 0x30ff, 'kana'),
+    (0x3130, 0x318f, 'hangul'),
+    (0x31f0, 0x31ff, 'kana'),
+    (0x3200, 0x33ff, common),
+    (0x3400, 0x4dbf, 'han'),
+    (0x4dc0, 0x4dff, common),
+    (0x4e00, 0x9fff, 'han'),
+    (0xa640, 0xa69f, 'cyrillic'),
+    (0xa720, 0xa7ff, 'latin'),
+    (0xac00, 0xd7ff, 'hangul'),
+    (0xf900, 0xfaff, 'han'),
+    (0xfb00, 0xfb06, 'latin'),
+    (0xfb1d, 0xfb4f, 'hebrew'),
+    (0xfb50, 0xfdff, 'arabic'),
+    (0xfe00, 0xfe6f, common),
+    (0xfe70, 0xfefe, 'arabic'),
+    (0xfeff, 0xff20, common),
+    (0xff21, 0xff3a, 'latin'),
+    (0xff3b, 0xff40, common),
+    (0xff41, 0xff5a, 'latin'),
+    (0xff5b, 0xff65, common),
+    (0xff66, 0xff9f, 'kana'),
+    (0xffa0, 0xffdc, 'hangul'),
+    (0xffe0, 0xffff, common),
+    (0x1f000, 0x1faff, common),
+    (0x20000, 0x2fa1f, 'han'),
+    (0x30000, 0x3134f, 'han'),
+    (0xe0000, 0xe01ef, common),
+)
+
+
+def range_index(ranges):
+    # range starts for bisect and the script of each, with the gaps as other
+    starts = []
+    names = []
+    end = 0
+    for first, last, script in ranges:
+        if first > end:
+            starts.append(end)
+            names.append(other)
+        starts.append(first)
+        names.append(script)
+        end = last + 1
+    starts.append(end)
+    names.append(other)
+    return starts, names
+
+
+range_starts, range_scripts = range_index(script_ranges)
+
+# one letter stands for each script in the translate output, as unicode so
+# unicode.translate takes it on Python 2 too
+code_letters = u'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+scripts = sorted(set(range_scripts))
+script_codes = dict((s, code_letters[i]) for i, s in enumerate(scripts))
+code_scripts = dict((c, s) for s, c in script_codes.items())
+
+
+def script_of(cp):
+    return range_scripts[bisect.bisect_right(range_starts, cp) - 1]
+
+
+class ScriptTable(dict):
+    # code point to script code, filled in as code points are seen
+
+    def __missing__(self, cp):
+        code = script_codes[script_of(cp)]
+        self[cp] = code
+        return code
+
+
+script_table = ScriptTable()
+
+# runs of one script code
+run_re = re.compile(r'(.)\1*', re.S)
+
+
+def script_runs(line):
+    # (script, text) for each run of one script in line
+    codes = line.translate(script_table)
+    for m in run_re.finditer(codes):
+        yield code_scripts[m.group(1)], line[m.start():m.end()]
+
+
+def split_scripts_line(line):
+    # the text of each script in line, common runs go with the run before
+    # them or, at the start of the line, the run after
+    parts = collections.OrderedDict()
+    pending = u''
+    current = None
+    for script, text in script_runs(line):
+        if script == common:
+            if current is None:
+                pending += text
+            else:
+                parts[current] += text
+            continue
+        current = script
+        parts[script] = parts.get(script, u'') + pending + text
+        pending = u''
+    if current is None and pending:
+        parts[common] = pending
+    return parts
+
+
+def split_scripts(options, text_runs):
+    # lines for each script, in the order the scripts are first seen
+    if not isinstance(text_runs, (tuple, list)):
+        text_runs = [text_runs, ]
+
+    outlines = {}
+    order = []
+    for l in text_runs:
+        # lines end at \n or \r, lines that are only whitespace are dropped
+        for line in l.replace(u'\r', u'\n').split(u'\n'):
+            if not line.strip():
+                continue
+            for script, text in split_scripts_line(line).items():
+                if text.strip():
+                    if script not in outlines:
+                        outlines[script] = []
+                        order.append(script)
+                    outlines[script].append(text)
+    return [(s, outlines[s]) for s in order]
+
+
+def split_scripts_row(options, row):
+    # the cells of each script in row; numbers, dates and common text are in
+    # every script's row
+    texts = []
+    found = []
+    for cell in row:
+        if cell is None or cell == u'':
+            texts.append(None)
+        elif not is_astring(options, cell):
+            texts.append(str(cell))
+        else:
+            parts = split_scripts_line(cell.strip().replace(u'\r', u'').replace(u'\n', u''))
+            if common in parts and len(parts) == 1:
+                texts.append(parts[common])
+                continue
+            texts.append(parts)
+            for script in parts:
+                if script not in found:
+                    found.append(script)
+
+    if not found:
+        found = [common]
+    rows = []
+    for script in found:
+        line = []
+        for text in texts:
+            if text is None:
+                line.append(u'')
+            elif isinstance(text, dict):
+                line.append(text.get(script, u''))
+            else:
+                line.append(text)
+        rows.append((script, line))
+    return rows
+
+
+def write_out_scripts(options, filename, text_runs):
+    outlines = split_scripts(options, text_runs)
+    if options.file_stats is not None:
+        lap(options.file_stats, 'split')
+    for script, lines in outlines:
+        write_text_runs(options, output_filename(options, filename, script=script), lines)
+
+
+def write_csv_scripts(options, filename, rows, sheet=None):
+    # a file for each script as it is first seen, so the workbook is still streamed
+    outs = {}
+    stats = options.file_stats
+    try:
+        for row in rows:
+            if not any(cell is not None for cell in row):
+                continue
+            for script, line in split_scripts_row(options, row):
+                if stats is not None:
+                    lap(stats, 'split')
+                out = outs.get(script)
+                if out is None:
+                    out = outs[script] = TextRunWriter(options, output_filename(options, filename, sheet=sheet, script=script), is_csv=True)
+                out.write(line)
+    finally:
+        for out in outs.values():
+            out.close()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# off2txt: server and client
+# a server keeps one warm process, with the Office libraries loaded, that runs
+# extractions sent to it over a Unix domain socket
+#
+# the protocol is one line of JSON each way per connection
+# request: {"argv": [...], "cwd": "..."} with argv as given to main()
+# response: {"exit_status": 0, "stdout": "...", "stderr": "...", "outputs": [...]}
+import json
+import os
+import signal
+import socket
+import sys
+
+from .logger import error, info
+from .off2txt import exit_statuses, run_options, writerr
+
+if sys.version_info.major == 2:
+    from StringIO import StringIO
+else:
+    from io import StringIO
+
+
+# seconds a client has to send its request or read the response
+client_timeout = 30
+
+# seconds between checks for a stop signal while waiting for a client, the
+# signal can be taken by one of the pool's threads, which leaves accept() waiting
+accept_interval = 1
+
+
+def preload(options):
+    # import everything an extraction may need before any workers are forked
+    import docx  # noqa: F401
+    import openpyxl  # noqa: F401
+    import pptx  # noqa: F401
+    from . import cache, fast, manifest  # noqa: F401
+
+
+def strip_connect(argv):
+    # the arguments to send to the server; argv has already been parsed, so
+    # an abbreviation of --connect, such as --conn, is not ambiguous
+    args = []
+    skip = False
+    for i, a in enumerate(argv):
+        name = a.split('=', 1)[0]
+        if skip:
+            skip = False
+        elif a == '--':
+            args.extend(argv[i:])
+            break
+        elif len(name) > 2 and '--connect'.startswith(name):
+            # the socket is the next argument unless given with =
+            skip = name == a
+        else:
+            args.append(a)
+    return args
+
+
+def read_message(conn):
+    with conn.makefile('rb') as fp:
+        line = fp.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf8'))
+
+
+def send_message(conn, message):
+    conn.sendall(json.dumps(message).encode('utf8') + b'\n')
+
+
+def parse_request(argv, stdout, stderr):
+    # argparse writes usage errors to sys.stderr and exits
+    from .options import parse_opts
+
+    saved = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        return parse_opts(argv, stdout=stdout, stderr=stderr), None
+    except SystemExit as e:
+        code = e.code
+        if code is None:
+            code = 0
+        return None, code
+    finally:
+        sys.stdout, sys.stderr = saved
+
+
+def run_request(server_options, request):
+    stdout = StringIO()
+    stderr = StringIO()
+    outputs = []
+    exit_status = exit_statuses['error']
+
+    cwd = os.getcwd()
+    try:
+        os.chdir(request.get('cwd') or cwd)
+        options, exit_status = parse_request(request['argv'], stdout, stderr)
+        if options is not None:
+            if options.serve or options.connect:
+                writerr(options, 'Server requests cannot use --serve or --connect')
+                exit_status = exit_statuses['error']
+            elif options.files_from == '-':
+                # the server's standard input is not the client's
+                writerr(options, 'Server requests cannot read names from standard input')
+                exit_status = exit_statuses['error']
+            else:
+                if server_options.pool is not None:
+                    options.pool = server_options.pool
+                    options.jobs = server_options.jobs
+                options.run_outputs = outputs
+                exit_status = run_options(options)
+    except Exception as e:
+        stderr.write('off2txt server exception: %s\n' % e)
+        error('run_request: exception', exc_info=True)
+        exit_status = exit_statuses['error']
+    finally:
+        os.chdir(cwd)
+
+    return {
+        'exit_status': exit_status,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+        'outputs': [os.path.join(request.get('cwd') or cwd, o) for o in outputs]
+    }
+
+
+def handle_connection(options, conn):
+    # a client that connects and sends nothing must not hold up the server
+    conn.settimeout(client_timeout)
+    try:
+        request = read_message(conn)
+        if request is None:
+            return
+        send_message(conn, run_request(options, request))
+    except Exception as e:
+        error('handle_connection: exception: %s' % e, exc_info=True)
+
+
+def open_socket(path):
+    # remove a socket left behind by a server that did not shut down cleanly
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            os.remove(path)
+        else:
+            probe.close()
+            raise RuntimeError('Server already running on %s' % path)
+
+    # only the user running the server can connect, requests read and write
+    # files as that user; the socket is bound under another name and moved
+    # into place once it is listening, so a client never finds a socket that
+    # refuses connections
+    tmp = '%s.%d' % (path, os.getpid())
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        sock.bind(tmp)
+    finally:
+        os.umask(umask)
+    os.chmod(tmp, 0o600)
+    sock.listen(16)
+    os.rename(tmp, path)
+    return sock
+
+
+# set by SIGTERM; a request that is running is finished before the server stops
+stop_requested = False
+
+
+def stop(signum, frame):
+    global stop_requested
+    stop_requested = True
+
+
+def serve(options):
+    global stop_requested
+    stop_requested = False
+    signal.signal(signal.SIGTERM, stop)
+
+    sock = None
+    try:
+        # the pool is started before the socket is there for clients to find
+        try:
+            preload(options)
+            if options.jobs > 1:
+                import multiprocessing
+                options.pool = multiprocessing.Pool(processes=options.jobs)
+            sock = open_socket(options.serve)
+        except Exception as e:
+            writerr(options, 'Exception starting server on: %s' % options.serve, exception=e)
+            return exit_statuses['error']
+
+        info('serving on %s' % options.serve)
+        sock.settimeout(accept_interval)
+        # requests are run one at a time, each may use the whole pool
+        while not stop_requested:
+            try:
+                conn, address = sock.accept()
+            except socket.timeout:
+                continue
+            try:
+                handle_connection(options, conn)
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sock is not None:
+            sock.close()
+            try:
+                os.remove(options.serve)
+            except OSError:
+                pass
+        if options.pool is not None:
+            options.pool.terminate()
+            options.pool.join()
+            options.pool = None
+
+    return exit_statuses['extracted']
+
+
+def connect(options, argv):
+    request = {
+        'argv': strip_connect(argv),
+        'cwd': os.getcwd()
+    }
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(options.connect)
+        send_message(sock, request)
+        response = read_message(sock)
+    except Exception as e:
+        writerr(options, 'Exception connecting to server on: %s' % options.connect, exception=e)
+        return exit_statuses['error']
+    finally:
+        sock.close()
+
+    if response is None:
+        writerr(options, 'No response from server on: %s' % options.connect)
+        return exit_statuses['error']
+
+    if response['stdout']:
+        options.stdout.write(response['stdout'])
+    if response['stderr']:
+        options.stderr.write(response['stderr'])
+    return response['exit_status']
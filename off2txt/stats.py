@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# off2txt: timing and memory statistics for --stats
+# each file records the wall time of its phases, bytes in and out, the number
+# of text runs or rows and its peak traced memory; the run writes them all to
+# a JSON file with the totals and prints a summary to stderr
+import json
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+phases = ('open', 'parse', 'split', 'write')
+
+# files listed in the stderr summary
+slowest_count = 5
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def start_tracing():
+    # True if tracing was started here
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        return True
+    return False
+
+
+def start_stats(options):
+    options.run_stats = {
+        'start': timer(),
+        'files': [],
+        'tracing': start_tracing()
+    }
+
+
+def begin_file_stats(options, path):
+    start_tracing()
+    if tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+    now = timer()
+    options.file_stats = {
+        'path': path,
+        'start': now,
+        'lap': now,
+        'phases': dict((p, 0.0) for p in phases),
+        'bytes_in': 0,
+        'bytes_out': 0,
+        'text_runs': 0,
+    }
+
+
+def end_file_stats(options):
+    stats = options.file_stats
+    options.file_stats = None
+
+    stats['seconds'] = timer() - stats.pop('start')
+    del stats['lap']
+    stats['peak_memory'] = None
+    if tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+        stats['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    return stats
+
+
+def add_file_stats(options, stats):
+    if stats is not None:
+        options.run_stats['files'].append(stats)
+
+
+def lap(stats, phase):
+    # charge the time since the last lap to phase
+    now = timer()
+    stats['phases'][phase] += now - stats['lap']
+    stats['lap'] = now
+
+
+def timed_text_runs(stats, text_runs):
+    # time spent making a run or row is parse time, the rest is the writer's
+    for l in text_runs:
+        lap(stats, 'parse')
+        stats['text_runs'] += 1
+        yield l
+        lap(stats, 'write')
+
+
+def output_size(line, is_csv):
+    # UTF-8 bytes written for a line, including separators
+    if not is_csv:
+        return len(line.encode('utf8')) + 2
+    size = 0
+    for cell in line:
+        if cell is not None:
+            size += len((u'%s' % cell).encode('utf8'))
+    return size + max(len(line) - 1, 0) * 2 + 1
+
+
+def run_totals(options):
+    files = options.run_stats['files']
+    totals = {
+        'files': len(files),
+        'seconds': timer() - options.run_stats['start'],
+        'phases': dict((p, sum(f['phases'][p] for f in files)) for p in phases),
+        'bytes_in': sum(f['bytes_in'] for f in files),
+        'bytes_out': sum(f['bytes_out'] for f in files),
+        'text_runs': sum(f['text_runs'] for f in files),
+        'peak_memory': None,
+    }
+    peaks = [f['peak_memory'] for f in files if f['peak_memory'] is not None]
+    if peaks:
+        totals['peak_memory'] = max(peaks)
+    return totals
+
+
+def megabytes(n):
+    return n / (1024.0 * 1024)
+
+
+def write_summary(options, totals, files):
+    line = 'Stats: %d files in %.2fs, %.1fMB in, %.1fMB out, %d text runs' % (
+        totals['files'], totals['seconds'], megabytes(totals['bytes_in']), megabytes(totals['bytes_out']), totals['text_runs'])
+    if totals['peak_memory'] is not None:
+        line += ', peak memory %.1fMB' % megabytes(totals['peak_memory'])
+    options.stderr.write(line + '\n')
+    options.stderr.write('Stats: %s\n' % ', '.join('%s %.2fs' % (p, totals['phases'][p]) for p in phases))
+
+    slowest = sorted(files, key=lambda f: f['seconds'], reverse=True)[:slowest_count]
+    for f in slowest:
+        options.stderr.write('Stats: %.2fs %s\n' % (f['seconds'], f['path']))
+
+
+def write_stats(options):
+    totals = run_totals(options)
+    report = {
+        'total': totals,
+        'files': options.run_stats['files']
+    }
+    if options.run_stats['tracing']:
+        tracemalloc.stop()
+    options.run_stats = None
+
+    with open(options.stats, 'w') as fp:
+        json.dump(report, fp, indent=2, sort_keys=True)
+    write_summary(options, totals, report['files'])
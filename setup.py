@@ -74,6 +74,7 @@ setup(
     platforms=platforms,
     
     install_requires = ['lxml', 'openpyxl', 'python-docx', 'python-pptx'],
+    extras_require = {'parquet': ['pyarrow']},
 
     packages=find_packages(exclude=['tests']),
 
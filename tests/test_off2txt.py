@@ -3,18 +3,24 @@
 from __future__ import print_function
 
 import codecs
+import json
 import os
 import os.path
 import pytest
+import shutil
+import signal
 import stat
 import subprocess
 import sys
+import threading
+import time
 
 if sys.version_info.major == 2:
     from StringIO import StringIO
 else:
     from io import StringIO
 
+import off2txt
 import off2txt.options
 import off2txt.off2txt
 
@@ -189,6 +195,33 @@ class Cmd(object):
         return self.compare_files(good_out_file, test_out_file)
 
 
+def run(argv):
+    # main() with its output and errors captured
+    stdout = StringIO()
+    stderr = StringIO()
+    exitcode = off2txt.off2txt.main(argv, stdout=stdout, stderr=stderr)
+    return exitcode, stdout.getvalue(), stderr.getvalue()
+
+
+def run_errors(argv):
+    exitcode, stdout, stderr = run(argv)
+    return exitcode, stderr
+
+
+def run_error_lines(argv):
+    exitcode, stdout, stderr = run(argv)
+    return exitcode, stderr.strip().split('\n')
+
+
+def read_outputs(outdir):
+    # output file name to contents
+    outputs = {}
+    for f in sorted(os.listdir(outdir)):
+        with codecs.open(os.path.join(outdir, f), 'r', 'utf8') as fp:
+            outputs[f] = fp.read()
+    return outputs
+
+
 some_bad_option = '--some-bad-option'
 usage_string_expanded = 'usage: %s' % (off2txt.options.usage_string % {'prog': off2txt.options.program_name})
 some_bad_option_error_msg = '%(prog)s: error: unrecognized arguments: %(option)s' % {'prog': off2txt.options.program_name, 'option': some_bad_option}
@@ -203,6 +236,14 @@ cmds = [
     Cmd('-X -d tests-out/docx tests/docx/in/03.docx'),
     Cmd('-X -d tests-out/docx -s tests/docx/in/03.docx'),
     
+    # word, fast engine
+    Cmd('-X --engine fast -d tests-out/docx tests/docx/in/01.docx'),
+    Cmd('-X --engine fast -d tests-out/docx -s tests/docx/in/01.docx'),
+    Cmd('-X --engine fast -d tests-out/docx tests/docx/in/02.docx'),
+    Cmd('-X --engine fast -d tests-out/docx -s tests/docx/in/02.docx'),
+    Cmd('-X --engine fast -d tests-out/docx tests/docx/in/03.docx'),
+    Cmd('-X --engine fast -d tests-out/docx -s tests/docx/in/03.docx'),
+
     # PowerPoint
     Cmd('-X -d tests-out/pptx tests/pptx/in/01.pptx'),
     Cmd('-X -d tests-out/pptx -s tests/pptx/in/01.pptx'),
@@ -211,6 +252,14 @@ cmds = [
     Cmd('-X -d tests-out/pptx tests/pptx/in/03.pptx'),
     Cmd('-X -d tests-out/pptx -s tests/pptx/in/03.pptx'),
     
+    # PowerPoint, fast engine
+    Cmd('-X --engine fast -d tests-out/pptx tests/pptx/in/01.pptx'),
+    Cmd('-X --engine fast -d tests-out/pptx -s tests/pptx/in/01.pptx'),
+    Cmd('-X --engine fast -d tests-out/pptx tests/pptx/in/02.pptx'),
+    Cmd('-X --engine fast -d tests-out/pptx -s tests/pptx/in/02.pptx'),
+    Cmd('-X --engine fast -d tests-out/pptx tests/pptx/in/03.pptx'),
+    Cmd('-X --engine fast -d tests-out/pptx -s tests/pptx/in/03.pptx'),
+
     # Excel
     Cmd('-X -d tests-out/xlsx tests/xlsx/in/01.xlsx'),
     Cmd('-X -d tests-out/xlsx -s tests/xlsx/in/01.xlsx'),
@@ -218,6 +267,18 @@ cmds = [
     Cmd('-X -d tests-out/xlsx -s tests/xlsx/in/02.xlsx'),
     Cmd('-X -d tests-out/xlsx tests/xlsx/in/03.xlsx'),
     Cmd('-X -d tests-out/xlsx -s tests/xlsx/in/03.xlsx'),
+
+    # Excel, fast engine
+    Cmd('-X --engine fast -d tests-out/xlsx tests/xlsx/in/01.xlsx'),
+    Cmd('-X --engine fast -d tests-out/xlsx -s tests/xlsx/in/01.xlsx'),
+    Cmd('-X --engine fast -d tests-out/xlsx tests/xlsx/in/02.xlsx'),
+    Cmd('-X --engine fast -d tests-out/xlsx -s tests/xlsx/in/02.xlsx'),
+    Cmd('-X --engine fast -d tests-out/xlsx tests/xlsx/in/03.xlsx'),
+    Cmd('-X --engine fast -d tests-out/xlsx -s tests/xlsx/in/03.xlsx'),
+
+    # parallel
+    Cmd('-X -j 2 -d tests-out/docx tests/docx/in/01.docx tests/docx/in/03.docx'),
+    Cmd('-X -j 2 -d tests-out/xlsx -s tests/xlsx/in/01.xlsx tests/xlsx/in/03.xlsx'),
 ]
 
 cmds_as_process = [
@@ -243,6 +304,1128 @@ class TestCmd(object):
         assert cmd.files_match()
 
 
+class TestSplit(object):
+    def test_split_ascii_unicode(self):
+        runs = [u'one\r\ntwo \u4e00\u4e8c', u'  \n\u4e09 \u3000\rthree', u'\u56db', u'']
+        assert off2txt.off2txt.split_ascii_unicode(None, runs) == (
+            [u'one', u'two ', u'three'],
+            [u'\u4e00\u4e8c', u'\u4e09\u3000', u'\u56db']
+        )
+
+    def test_split_ascii_unicode_whitespace_only(self):
+        assert off2txt.off2txt.split_ascii_unicode(None, [u'\u4e00 \u4e8c \n']) == ([], [u'\u4e00\u4e8c'])
+        assert off2txt.off2txt.split_ascii_unicode(None, u'abc') == ([u'abc'], [])
+
+    def test_split_ascii_unicode_line(self):
+        assert off2txt.off2txt.split_ascii_unicode_line(None, u'a\u4e00\nb\r\u4e8c') == (u'ab', u'\u4e00\u4e8c')
+        assert off2txt.off2txt.split_ascii_unicode_line(None, u'') == (None, None)
+
+    def test_split_ascii_unicode_csv(self):
+        rows = [[u' abc ', None, 3, u'x\u4e00y']]
+        assert off2txt.off2txt.split_ascii_unicode_csv(None, rows) == (
+            [[u'abc', u'', u'3', u'xy']],
+            [[u'', u'', u'3', u'\u4e00']]
+        )
+
+
+class TestJobs(object):
+    def test_shared_options_size(self):
+        # the task sent for each input does not grow with the number of inputs
+        import pickle
+        sizes = []
+        for count in (1, 20000):
+            files = ['in/%05d.docx' % i for i in range(count)]
+            options = off2txt.options.parse_opts(['-j', '2'] + files, stderr=StringIO())
+            options.made_dirs.update(files)
+            sizes.append(len(pickle.dumps(off2txt.off2txt.shared_options(options))))
+        assert sizes[0] == sizes[1]
+
+    def test_worker_spool(self, tmpdir):
+        # a worker hands back temp files for the parent to append, not the lines
+        output = str(tmpdir.join('out.txt'))
+        options = off2txt.options.parse_opts(['-j', '2', '-o', output, 'tests/docx/in/02.docx'], stderr=StringIO())
+        shared = off2txt.off2txt.shared_options(options)
+        result = off2txt.off2txt.off2txt_file_worker((shared, 'tests/docx/in/02.docx', None, None, None))
+        writes = result[3]
+        assert [filename for filename, spool in writes] == [output]
+        assert all(os.path.exists(spool) for filename, spool in writes)
+
+        options.output_pool = off2txt.off2txt.OutputPool(options)
+        off2txt.off2txt.replay_writes(options, writes)
+        options.output_pool.close()
+        assert not any(os.path.exists(spool) for filename, spool in writes)
+        with codecs.open(output, 'r', 'utf8') as fp, codecs.open('tests/docx/out/02.txt', 'r', 'utf8') as good:
+            assert fp.read() == good.read()
+
+    def test_jobs_output_order(self, tmpdir):
+        inputs = ['tests/docx/in/01.docx', 'tests/docx/in/02.docx', 'tests/docx/in/03.docx']
+        output = str(tmpdir.join('combined.txt'))
+        argv = ['-j', '3', '-o', output] + inputs
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+
+        good = ''
+        for i in inputs:
+            with codecs.open(i.replace('in', 'out').replace('.docx', '.txt'), 'r', 'utf8') as fp:
+                good += fp.read()
+        with codecs.open(output, 'r', 'utf8') as fp:
+            assert fp.read() == good
+
+    def test_jobs_error_reporting(self, tmpdir):
+        stderr = StringIO()
+        argv = ['-j', '2', '-d', str(tmpdir), 'tests/docx/in/01.docx', 'tests/docx/in/nothere.docx', 'tests/test_off2txt.py']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=stderr) == 2
+        assert stderr.getvalue().strip().split('\n') == [
+            'File does not exist: tests/docx/in/nothere.docx',
+            'Unknown extension: .py',
+        ]
+
+    @pytest.mark.parametrize('args', [[], ['-j', '2']])
+    def test_missing_unknown_extension(self, tmpdir, args):
+        # the file access check comes before the extension check
+        stderr = StringIO()
+        argv = args + ['-d', str(tmpdir), 'tests/docx/in/nothere.bar']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=stderr) == 1
+        assert stderr.getvalue() == 'File does not exist: tests/docx/in/nothere.bar\n'
+
+        stderr = StringIO()
+        assert off2txt.off2txt.main(['-A'] + argv, stdout=StringIO(), stderr=stderr) == 1
+        assert stderr.getvalue() == ''
+
+
+class TestStreams(object):
+    inputs = ['tests/docx/in/01.docx', 'tests/docx/in/02.docx']
+
+    def expected(self):
+        good = ''
+        for i in self.inputs:
+            with codecs.open(i.replace('in', 'out').replace('.docx', '.txt'), 'r', 'utf8') as fp:
+                good += fp.read()
+        return good
+
+    def test_output_to_stdout(self, tmpdir):
+        stdout = StringIO()
+        argv = ['-o', '-'] + self.inputs
+        assert off2txt.off2txt.main(argv, stdout=stdout, stderr=StringIO()) == 0
+        assert stdout.getvalue() == self.expected()
+        assert not os.path.exists('-')
+
+    def test_output_to_stdout_jobs(self):
+        stdout = StringIO()
+        argv = ['-j', '2', '-o', '-'] + self.inputs
+        assert off2txt.off2txt.main(argv, stdout=stdout, stderr=StringIO()) == 0
+        assert stdout.getvalue() == self.expected()
+
+    def test_files_from_stdin(self):
+        stdout = StringIO()
+        stdin = StringIO(u'\0'.join(self.inputs) + u'\0')
+        argv = ['--files-from', '-', '-o', '-']
+        assert off2txt.off2txt.main(argv, stdin=stdin, stdout=stdout, stderr=StringIO()) == 0
+        assert stdout.getvalue() == self.expected()
+
+    def test_files_from_file(self, tmpdir):
+        names = tmpdir.join('names')
+        names.write_binary(b'\0'.join(i.encode('utf8') for i in self.inputs))
+        stdout = StringIO()
+        argv = ['--files-from', str(names), '-o', '-', self.inputs[0]]
+        assert off2txt.off2txt.main(argv, stdout=stdout, stderr=StringIO()) == 0
+        with codecs.open('tests/docx/out/01.txt', 'r', 'utf8') as fp:
+            first = fp.read()
+        # positional files come before the listed ones
+        assert stdout.getvalue() == first + self.expected()
+
+    def test_read_null_separated(self):
+        import io
+        fp = io.BytesIO(b'a\0bb\0\0' + b'c' * 70000 + b'\0d')
+        assert list(off2txt.off2txt.read_null_separated(fp)) == [b'a', b'bb', b'c' * 70000, b'd']
+
+    def test_read_null_separated_pipe(self):
+        import io
+        import threading
+        r, w = os.pipe()
+        # the writer stays open, a name must not wait for a full chunk
+        os.write(w, b'a\0b')
+        timer = threading.Timer(5, os.close, (w, ))
+        timer.start()
+        try:
+            with io.open(r, 'rb') as fp:
+                names = off2txt.off2txt.read_null_separated(fp)
+                start = time.time()
+                assert next(names) == b'a'
+                assert time.time() - start < 5
+        finally:
+            timer.cancel()
+            timer.join()
+            try:
+                os.close(w)
+            except OSError:
+                pass
+
+
+class TestPreflight(object):
+    def test_absolute_outdir(self, tmpdir):
+        outdir = tmpdir.join('a', 'b')
+        argv = ['-d', str(outdir), 'tests/docx/in/01.docx', 'tests/docx/in/02.docx']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert sorted(os.listdir(str(outdir))) == ['01.txt', '02.txt']
+
+    def test_outdir_made_once(self, tmpdir, monkeypatch):
+        made = []
+        makedirs = os.makedirs
+
+        def record(path, *args, **kwargs):
+            made.append(path)
+            return makedirs(path, *args, **kwargs)
+        monkeypatch.setattr(os, 'makedirs', record)
+
+        outdir = str(tmpdir.join('out'))
+        argv = ['-s', '-d', outdir, 'tests/docx/in/01.docx', 'tests/docx/in/02.docx']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert made == [outdir]
+
+    def test_broken_symlink(self, tmpdir):
+        link = tmpdir.join('broken.docx')
+        link.mksymlinkto(tmpdir.join('nothere.docx'))
+        stderr = StringIO()
+        argv = ['-d', str(tmpdir), str(link)]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=stderr) == 1
+        assert stderr.getvalue() == 'Broken symlink: %s\n' % link
+
+
+class TestPipeline(object):
+    inputs = ['tests/docx/in/01.docx', 'tests/pptx/in/03.pptx', 'tests/docx/in/nothere.docx', 'tests/xlsx/in/02.xlsx', 'tests/docx/in/03.docx']
+
+    @pytest.mark.parametrize('jobs', ['1', '2'])
+    def test_pipeline_matches_serial(self, tmpdir, jobs):
+        serial = str(tmpdir.mkdir('serial'))
+        pipeline = str(tmpdir.mkdir('pipeline'))
+        expected = run_errors(['-s', '-d', serial] + self.inputs)
+        assert run_errors(['-s', '--prefetch', '2', '-j', jobs, '-d', pipeline] + self.inputs) == expected
+        assert read_outputs(pipeline) == read_outputs(serial)
+
+    def test_pipeline_output_order(self, tmpdir):
+        serial = str(tmpdir.join('serial.txt'))
+        pipeline = str(tmpdir.join('pipeline.txt'))
+        inputs = [i for i in self.inputs if i.endswith('.docx')] * 3
+        run_errors(['-o', serial] + inputs)
+        run_errors(['--prefetch', '1', '-j', '2', '-o', pipeline] + inputs)
+        with codecs.open(serial, 'r', 'utf8') as fp:
+            expected = fp.read()
+        with codecs.open(pipeline, 'r', 'utf8') as fp:
+            assert fp.read() == expected
+
+    def test_prefetch_needs_async(self, monkeypatch, capsys):
+        monkeypatch.setattr(sys, 'version_info', (3, 4, 10))
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(['--prefetch', '2', 'x.docx'], stderr=StringIO())
+        assert 'argument --prefetch: needs Python 3.5 or later' in capsys.readouterr().err
+
+
+class TestJsonl(object):
+    def run(self, argv):
+        stdout = StringIO()
+        assert off2txt.off2txt.main(['--format', 'jsonl'] + argv, stdout=stdout, stderr=StringIO()) == 0
+        return [json.loads(l) for l in stdout.getvalue().splitlines()]
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_records(self, engine):
+        records = self.run(['--engine', engine, '-o', '-', 'tests/docx/in/02.docx', 'tests/pptx/in/03.pptx', 'tests/xlsx/in/02.xlsx'])
+        assert records[0] == {'path': 'tests/docx/in/02.docx', 'format': 'docx', 'paragraph': 1, 'text': u'This is the heading'}
+        assert [r['format'] for r in records] == ['docx'] * 4 + ['pptx'] * 4 + ['xlsx'] * 2
+        assert [(r['slide'], r['paragraph']) for r in records if r['format'] == 'pptx'] == [(1, 1), (1, 2), (2, 1), (2, 2)]
+        assert records[-1] == {
+            'path': 'tests/xlsx/in/02.xlsx', 'format': 'xlsx', 'sheet': 'Sheet1', 'row': 2,
+            'cells': [u'a2 中文', u'b2 中文', u'c2 中文']
+        }
+
+    def test_split(self):
+        records = self.run(['-s', '-o', '-', 'tests/docx/in/01.docx', 'tests/xlsx/in/02.xlsx'])
+        assert records[0] == {'path': 'tests/docx/in/01.docx', 'format': 'docx', 'paragraph': 1, 'ascii': u'This is the heading', 'unicode': u''}
+        assert records[-1]['ascii'] == [u'a2 ', u'b2 ', u'c2 ']
+        assert records[-1]['unicode'] == [u'中文', u'中文', u'中文']
+
+    def test_output_file(self, tmpdir):
+        argv = ['--format', 'jsonl', '-s', '-d', str(tmpdir), 'tests/docx/in/01.docx', 'tests/xlsx/in/01.xlsx']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert sorted(os.listdir(str(tmpdir))) == ['01.jsonl']
+        with codecs.open(str(tmpdir.join('01.jsonl')), 'r', 'utf8') as fp:
+            formats = [json.loads(l)['format'] for l in fp]
+        assert formats[0] == 'docx'
+        assert formats[-1] == 'xlsx'
+
+    def test_sheets_jobs(self, tmpdir):
+        workbook = TestSheets().make_workbook(tmpdir)
+        serial = self.run(['-o', '-', workbook])
+        assert self.run(['--sheets', '-j', '2', '-o', '-', workbook]) == serial
+        assert [(r['sheet'], r['row']) for r in serial] == [('First', 1), ('First', 2), (u'Q1 "x"', 1)]
+
+    def test_non_finite(self, monkeypatch):
+        def sheets(options, fp, names=None):
+            yield u'Sheet1', iter([(1.5, float('nan'), float('inf'), float('-inf'))])
+        monkeypatch.setitem(off2txt.off2txt.sheet_engines, 'library', sheets)
+        stdout = StringIO()
+        assert off2txt.off2txt.main(['--format', 'jsonl', '-o', '-', 'tests/xlsx/in/01.xlsx'], stdout=stdout, stderr=StringIO()) == 0
+        assert stdout.getvalue().endswith('"cells": [1.5, null, null, null], "format": "xlsx", "path": "tests/xlsx/in/01.xlsx", "row": 1, "sheet": "Sheet1"}\n')
+
+
+class TestParquet(object):
+    def run(self, argv, outdir):
+        argv = ['--format', 'parquet', '-d', str(outdir)] + argv
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        return sorted(os.listdir(str(outdir)))
+
+    def read(self, filename):
+        pq = pytest.importorskip('pyarrow.parquet')
+        table = pq.read_table(str(filename))
+        return [str(t) for t in table.schema.types], table.to_pylist()
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_sheets(self, tmpdir, engine):
+        pytest.importorskip('pyarrow')
+        workbook = TestSheets().make_workbook(tmpdir)
+        outdir = tmpdir.mkdir('out')
+        assert self.run(['--engine', engine, workbook, 'tests/docx/in/01.docx'], outdir) == ['01.txt', 'multi-First.parquet', 'multi-Q1 _x_.parquet']
+        assert self.read(outdir.join('multi-First.parquet')) == (['string', 'string'], [{'A': u'a', 'B': u'b'}, {'A': u'中文 text', 'B': u'2'}])
+        assert self.read(outdir.join('multi-Q1 _x_.parquet')) == (['string', 'string'], [{'A': u'x', 'B': u'y'}])
+
+    def make_types(self, tmpdir):
+        import openpyxl
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = 'Data'
+        for row in ([1, 1, None], [2, 2.5, None], [3, u'three', u'late'], [4, 4, None, 5]):
+            ws.append(row)
+        workbook = str(tmpdir.join('types.xlsx'))
+        wb.save(workbook)
+        return workbook
+
+    def test_types(self, tmpdir):
+        pytest.importorskip('pyarrow')
+        workbook = self.make_types(tmpdir)
+        outdir = tmpdir.mkdir('out')
+        assert self.run([workbook], outdir) == ['types-Data.parquet']
+        types, rows = self.read(outdir.join('types-Data.parquet'))
+        assert types == ['int64', 'string', 'string', 'int64']
+        assert [r['A'] for r in rows] == [1, 2, 3, 4]
+        assert [r['B'] for r in rows] == [u'1', u'2.5', u'three', u'4']
+        assert [r['C'] for r in rows] == [None, None, u'late', None]
+
+    def test_types_fixed(self, tmpdir, monkeypatch):
+        pytest.importorskip('pyarrow')
+        workbook = self.make_types(tmpdir)
+
+        # a batch per row so the types come from the first row alone
+        monkeypatch.setattr('off2txt.parquet.batch_size', 1)
+        outdir = tmpdir.mkdir('out')
+        stderr = StringIO()
+        assert off2txt.off2txt.main(['--format', 'parquet', '-d', str(outdir), workbook], stdout=StringIO(), stderr=stderr) == 2
+        filename = os.path.join(str(outdir), 'types-Data.parquet')
+        assert stderr.getvalue() == 'Values left empty as they do not fit the column type: %s: B: 2\n' % filename
+        types, rows = self.read(filename)
+        assert types == ['int64', 'int64', 'string', 'string']
+        assert [r['A'] for r in rows] == [1, 2, 3, 4]
+        assert [r['B'] for r in rows] == [1, None, None, 4]
+        assert [r['C'] for r in rows] == [None, None, u'late', None]
+        assert [r['D'] for r in rows] == [None, None, None, u'5']
+
+    def test_split_jobs(self, tmpdir):
+        pytest.importorskip('pyarrow')
+        serial = tmpdir.mkdir('serial')
+        parallel = tmpdir.mkdir('parallel')
+        assert self.run(['-s', 'tests/xlsx/in/02.xlsx'], serial) == ['02-Sheet1.parquet']
+        assert self.run(['-s', '-j', '2', 'tests/xlsx/in/02.xlsx'], parallel) == ['02-Sheet1.parquet']
+        types, rows = self.read(serial.join('02-Sheet1.parquet'))
+        assert self.read(parallel.join('02-Sheet1.parquet')) == (types, rows)
+        assert sorted(rows[-1]) == ['A-ascii', 'A-unicode', 'B-ascii', 'B-unicode', 'C-ascii', 'C-unicode']
+        assert (rows[-1]['A-ascii'], rows[-1]['A-unicode']) == (u'a2 ', u'中文')
+
+    def test_output_not_allowed(self):
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(['--format', 'parquet', '-o', 'out.parquet', 'x.xlsx'], stderr=StringIO())
+
+
+class TestCompress(object):
+    modules = {'gzip': ('gzip', '.gz'), 'bz2': ('bz2', '.bz2'), 'xz': ('lzma', '.xz')}
+
+    def read(self, compress, filename):
+        module = __import__(self.modules[compress][0])
+        with module.open(filename, 'rt', encoding='utf8', newline='') as fp:
+            return fp.read()
+
+    def good(self, filename):
+        with codecs.open(filename, 'r', 'utf8') as fp:
+            return fp.read()
+
+    @pytest.mark.parametrize('compress', ['gzip', 'bz2', 'xz'])
+    def test_compress(self, tmpdir, compress):
+        argv = ['-X', '--compress', compress, '--compress-level', '1', '-d', str(tmpdir), 'tests/docx/in/01.docx', 'tests/xlsx/in/02.xlsx']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        suffix = self.modules[compress][1]
+        assert sorted(os.listdir(str(tmpdir))) == ['01.txt' + suffix, '02.csv' + suffix]
+        assert self.read(compress, str(tmpdir.join('01.txt' + suffix))) == self.good('tests/docx/out/01.txt')
+        assert self.read(compress, str(tmpdir.join('02.csv' + suffix))) == self.good('tests/xlsx/out/02.csv')
+
+    def test_append_jobs(self, tmpdir):
+        output = str(tmpdir.join('all.txt.gz'))
+        inputs = ['tests/docx/in/01.docx', 'tests/docx/in/02.docx']
+        for jobs in ('1', '2'):
+            argv = ['--compress', 'gzip', '-j', jobs, '-o', output] + inputs
+            assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        good = self.good('tests/docx/out/01.txt') + self.good('tests/docx/out/02.txt')
+        assert self.read('gzip', output) == good * 2
+
+    @pytest.mark.parametrize('argv', [
+        ['--compress', 'gzip', '-o', '-'],
+        ['--compress-level', '5'],
+        ['--compress', 'bz2', '--compress-level', '0'],
+        ['--compress', 'xz', '--compress-level', '10'],
+    ])
+    def test_bad_options(self, argv):
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(argv + ['x.docx'], stderr=StringIO())
+
+
+class TestArchive(object):
+    def make_archives(self, tmpdir):
+        import tarfile
+        import zipfile
+        bundle = str(tmpdir.join('bundle.zip'))
+        with zipfile.ZipFile(bundle, 'w') as zf:
+            zf.write('tests/docx/in/01.docx', 'docs/01.docx')
+            zf.write('tests/xlsx/in/02.xlsx', '02.xlsx')
+            zf.writestr('notes.txt', 'not an Office file')
+        slides = str(tmpdir.join('slides.tar.gz'))
+        with tarfile.open(slides, 'w:gz') as tf:
+            tf.add('tests/pptx/in/01.pptx', 'deck/01.pptx')
+        return bundle, slides
+
+    def read(self, filename):
+        with codecs.open(str(filename), 'r', 'utf8') as fp:
+            return fp.read()
+
+    @pytest.mark.parametrize('jobs', ['1', '2'])
+    def test_members(self, tmpdir, jobs):
+        bundle, slides = self.make_archives(tmpdir)
+        argv = ['-X', '-j', jobs, bundle, slides]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert self.read(tmpdir.join('docs', '01.txt')) == self.read('tests/docx/out/01.txt')
+        assert self.read(tmpdir.join('02.csv')) == self.read('tests/xlsx/out/02.csv')
+        assert self.read(tmpdir.join('deck', '01.txt')) == self.read('tests/pptx/out/01.txt')
+        assert not tmpdir.join('notes.txt').exists()
+
+    def test_recursive_directory(self, tmpdir):
+        indir = tmpdir.mkdir('in')
+        self.make_archives(indir)
+        outdir = tmpdir.mkdir('out')
+        argv = ['-X', '-r', '--prefetch', '2', '-d', str(outdir), str(indir)]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert sorted(os.listdir(str(outdir))) == ['01.txt', '02.csv']
+
+    def test_unsafe_member(self, tmpdir):
+        import zipfile
+        bundle = str(tmpdir.mkdir('in').join('bundle.zip'))
+        with zipfile.ZipFile(bundle, 'w') as zf:
+            zf.write('tests/docx/in/01.docx', '../01.docx')
+            zf.write('tests/docx/in/02.docx', '02.docx')
+        stderr = StringIO()
+        assert off2txt.off2txt.main([bundle], stdout=StringIO(), stderr=stderr) == 2
+        assert stderr.getvalue() == 'Unsafe archive member name: %s: ../01.docx\n' % bundle
+        assert sorted(os.listdir(str(tmpdir))) == ['in']
+        assert sorted(os.listdir(str(tmpdir.join('in')))) == ['02.txt', 'bundle.zip']
+
+    def test_bad_archive(self, tmpdir):
+        bundle = tmpdir.join('bundle.zip')
+        bundle.write('not a zip file')
+        stderr = StringIO()
+        assert off2txt.off2txt.main([str(bundle)], stdout=StringIO(), stderr=stderr) == 2
+        assert stderr.getvalue() == 'Exception reading archive: %s\n' % bundle
+
+
+class TestSplitScripts(object):
+    def test_ranges(self):
+        import off2txt.scripts
+        ranges = off2txt.scripts.script_ranges
+        for (first, last, script), (next_first, next_last, next_script) in zip(ranges, ranges[1:]):
+            assert first <= last < next_first
+        assert off2txt.scripts.script_of(ord(u'a')) == 'latin'
+        assert off2txt.scripts.script_of(ord(u'中')) == 'han'
+        assert off2txt.scripts.script_of(0x20001) == 'han'
+        assert off2txt.scripts.script_of(0xe000) == 'other'
+        assert off2txt.scripts.script_of(0x10ffff) == 'other'
+
+    def test_split_line(self):
+        import off2txt.scripts
+        parts = off2txt.scripts.split_scripts_line(u'Hello, Привет мир! 中文 123 مرحبا')
+        assert list(parts.items()) == [('latin', u'Hello, '), ('cyrillic', u'Привет мир! '), ('han', u'中文 123 '), ('arabic', u'مرحبا')]
+        assert off2txt.scripts.split_scripts_line(u'- 1, 2 -') == {'common': u'- 1, 2 -'}
+        assert off2txt.scripts.split_scripts_line(u'(中文)') == {'han': u'(中文)'}
+
+    def test_files(self, tmpdir):
+        argv = ['-X', '--split-scripts', '-d', str(tmpdir), 'tests/docx/in/02.docx', 'tests/xlsx/in/02.xlsx']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert sorted(os.listdir(str(tmpdir))) == ['02-han.csv', '02-han.txt', '02-latin.csv', '02-latin.txt']
+        assert tmpdir.join('02-latin.txt').read_text('utf8') == u'This is the heading\n\nThis is the body\n\n'
+        assert tmpdir.join('02-han.csv').read_text('utf8').splitlines()[-1] == u'中文, 中文, 中文'
+
+    def test_rows(self, tmpdir):
+        import openpyxl
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append([u'name', u'имя', 1])
+        ws.append([5, None, 6])
+        workbook = str(tmpdir.join('rows.xlsx'))
+        wb.save(workbook)
+        outdir = tmpdir.mkdir('out')
+        assert off2txt.off2txt.main(['--split-scripts', '-d', str(outdir), workbook], stdout=StringIO(), stderr=StringIO()) == 0
+        assert outdir.join('rows-latin.csv').read_text('utf8') == u'name, , 1\n'
+        assert outdir.join('rows-cyrillic.csv').read_text('utf8') == u', имя, 1\n'
+        assert outdir.join('rows-common.csv').read_text('utf8') == u'5, , 6\n'
+
+    @pytest.mark.parametrize('argv', [
+        ['--split-scripts', '-s'],
+        ['--split-scripts', '--format', 'jsonl'],
+    ])
+    def test_bad_options(self, argv):
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(argv + ['x.docx'], stderr=StringIO())
+
+
+class TestCsvDialect(object):
+    def make_workbook(self, tmpdir):
+        import openpyxl
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append([u'a, b', None, 2])
+        ws.append([u'line\nbreak', u'say "hi"', 2.5])
+        workbook = str(tmpdir.join('cells.xlsx'))
+        wb.save(workbook)
+        return workbook
+
+    def run(self, tmpdir, argv):
+        workbook = self.make_workbook(tmpdir)
+        outdir = tmpdir.mkdir('out')
+        assert off2txt.off2txt.main(['-d', str(outdir)] + argv + [workbook], stdout=StringIO(), stderr=StringIO()) == 0
+        with open(str(outdir.join('cells.csv')), 'rb') as fp:
+            return fp.read().decode('utf8')
+
+    def test_plain_blank_and_number_cells(self, tmpdir):
+        assert self.run(tmpdir, []) == u'a, b, , 2\nline\nbreak, say "hi", 2.5\n'
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_excel(self, tmpdir, engine):
+        assert self.run(tmpdir, ['--engine', engine, '--csv-dialect', 'excel']) == u'"a, b",,2\r\n"line\nbreak","say ""hi""",2.5\r\n'
+
+    def test_delimiter_batches(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(off2txt.off2txt, 'csv_batch_size', 1)
+        assert self.run(tmpdir, ['--csv-dialect', 'unix', '--csv-delimiter', ';', '-j', '2']) == u'"a, b";"";"2"\n"line\nbreak";"say ""hi""";"2.5"\n'
+
+    def test_split(self, tmpdir):
+        outdir = tmpdir.mkdir('out')
+        argv = ['-X', '-s', '--csv-dialect', 'excel-tab', '-d', str(outdir), 'tests/xlsx/in/02.xlsx']
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        with open(str(outdir.join('02-unicode.csv')), 'rb') as fp:
+            assert fp.read().decode('utf8').split(u'\r\n')[-2] == u'中文\t中文\t中文'
+
+    @pytest.mark.parametrize('argv', [
+        ['--csv-delimiter', ';'],
+        ['--csv-dialect', 'excel', '--csv-delimiter', ';;'],
+    ])
+    def test_bad_options(self, argv):
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(argv + ['x.xlsx'], stderr=StringIO())
+
+
+class TestOutputPool(object):
+    def test_overwrite_truncates_once(self, tmpdir):
+        inputs = ['tests/docx/in/01.docx', 'tests/docx/in/02.docx', 'tests/docx/in/03.docx']
+        output = tmpdir.join('combined.txt')
+        output.write('old text')
+        argv = ['-X', '-o', str(output)] + inputs
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+
+        good = ''
+        for i in inputs:
+            with codecs.open(i.replace('in', 'out').replace('.docx', '.txt'), 'r', 'utf8') as fp:
+                good += fp.read()
+        assert output.read_text('utf8') == good
+
+    def test_eviction(self, tmpdir):
+        options = off2txt.options.parse_opts(['x.docx'], stderr=StringIO())
+        pool = off2txt.off2txt.OutputPool(options, size=1)
+        a = str(tmpdir.join('a.txt'))
+        b = str(tmpdir.join('b.txt'))
+
+        pool.get(a, 'w').write(u'one\n')
+        assert pool.get(a, 'w') is pool.get(a, 'w')
+        pool.get(b, 'w').write(u'two\n')
+        assert list(pool.files) == [b]
+
+        # reopened after eviction, so appended to rather than truncated
+        pool.get(a, 'w').write(u'three\n')
+        pool.close()
+        assert pool.files == {}
+        assert tmpdir.join('a.txt').read_text('utf8') == u'one\nthree\n'
+        assert tmpdir.join('b.txt').read_text('utf8') == u'two\n'
+
+
+class TestStats(object):
+    inputs = ['tests/docx/in/02.docx', 'tests/pptx/in/03.pptx', 'tests/xlsx/in/02.xlsx']
+
+    def run_stats(self, tmpdir, argv):
+        stats = str(tmpdir.join('stats.json'))
+        stderr = StringIO()
+        argv = ['-X', '-s', '-d', str(tmpdir), '--stats', stats] + argv + self.inputs
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=stderr) == 0
+        with open(stats) as fp:
+            return json.load(fp), stderr.getvalue().strip().split('\n')
+
+    def test_stats(self, tmpdir):
+        report, summary = self.run_stats(tmpdir, [])
+        assert [f['path'] for f in report['files']] == self.inputs
+        for f in report['files']:
+            assert f['bytes_in'] == os.path.getsize(f['path'])
+            assert f['bytes_out'] > 0
+            assert f['text_runs'] > 0
+            assert f['peak_memory'] > 0
+            assert sum(f['phases'].values()) <= f['seconds']
+
+        total = report['total']
+        assert total['files'] == 3
+        assert total['bytes_in'] == sum(os.path.getsize(i) for i in self.inputs)
+        assert sorted(total['phases']) == ['open', 'parse', 'split', 'write']
+
+        assert len(summary) == 5
+        assert summary[0].startswith('Stats: 3 files in ')
+        assert summary[1].startswith('Stats: open ')
+
+    def test_stats_jobs(self, tmpdir):
+        serial, summary = self.run_stats(tmpdir, [])
+        parallel, summary = self.run_stats(tmpdir, ['-j', '2'])
+        assert [f['path'] for f in parallel['files']] == self.inputs
+        for key in ('bytes_in', 'bytes_out', 'text_runs'):
+            assert serial['total'][key] == parallel['total'][key]
+
+    @pytest.mark.parametrize('args', [['-j', '2'], ['-j', '2', '--prefetch', '2']])
+    def test_stats_jobs_write(self, tmpdir, monkeypatch, args):
+        # the writes are made by this process, not the workers
+        parent = os.getpid()
+        write_spool = off2txt.off2txt.TextRunWriter.write_spool
+
+        def slow(*args, **kwargs):
+            if os.getpid() == parent:
+                time.sleep(0.1)
+            return write_spool(*args, **kwargs)
+        monkeypatch.setattr(off2txt.off2txt.TextRunWriter, 'write_spool', slow)
+
+        report, summary = self.run_stats(tmpdir, args)
+        for f in report['files']:
+            assert f['phases']['write'] >= 0.1
+            assert sum(f['phases'].values()) <= f['seconds']
+
+
+class TestLimits(object):
+    def make_bomb(self, tmpdir):
+        import zipfile
+        bomb = str(tmpdir.join('bomb.docx'))
+        with zipfile.ZipFile(bomb, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('word/document.xml', b'\0' * (2 * 1024 * 1024))
+        return bomb
+
+    def test_max_size(self, tmpdir):
+        bomb = self.make_bomb(tmpdir)
+        argv = ['-d', str(tmpdir), '--max-size', '1', bomb, 'tests/docx/in/01.docx']
+        assert run_error_lines(argv) == (3, ['Skipped file: %s: uncompressed size of 2MB is over the limit of 1MB' % bomb])
+        assert tmpdir.join('01.txt').check()
+
+    def test_max_ratio(self, tmpdir):
+        bomb = self.make_bomb(tmpdir)
+        exitcode, errors = run_error_lines(['-d', str(tmpdir), '--max-ratio', '100', bomb, 'tests/docx/in/01.docx'])
+        assert exitcode == 3
+        assert len(errors) == 1
+        assert errors[0].startswith('Skipped file: %s: compression ratio of ' % bomb)
+        assert tmpdir.join('01.txt').check()
+
+    def test_max_memory_without_proc(self, monkeypatch, capsys):
+        exists = os.path.exists
+        monkeypatch.setattr(os.path, 'exists', lambda p: p != '/proc/self/statm' and exists(p))
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(['--max-memory', '100', 'x.docx'], stderr=StringIO())
+        assert 'argument --max-memory: not supported on this platform' in capsys.readouterr().err
+
+    def test_timeout(self, tmpdir, monkeypatch):
+        def slow(options, fp):
+            if fp.name.endswith('02.docx'):
+                time.sleep(10)
+            return [u'text']
+        monkeypatch.setitem(off2txt.off2txt.engines['library'], '.docx', slow)
+
+        start = time.time()
+        argv = ['-d', str(tmpdir), '--timeout', '0.2', 'tests/docx/in/02.docx', 'tests/docx/in/01.docx']
+        assert run_error_lines(argv) == (3, ['Skipped file: tests/docx/in/02.docx: took longer than 0.2 seconds'])
+        assert time.time() - start < 5
+        assert tmpdir.join('01.txt').read() == 'text\n\n'
+
+    @pytest.mark.parametrize('args', [[], ['-j', '2'], ['--compress', 'gzip']])
+    def test_timeout_partial_output(self, tmpdir, monkeypatch, args):
+        def slow(options, fp):
+            yield u'text'
+            if fp.name.endswith('02.docx'):
+                yield u'partial'
+                time.sleep(10)
+        monkeypatch.setitem(off2txt.off2txt.engines['library'], '.docx', slow)
+
+        outdir = tmpdir.mkdir('out')
+        combined = str(tmpdir.join('combined.txt'))
+        inputs = ['tests/docx/in/01.docx', 'tests/docx/in/02.docx', 'tests/docx/in/03.docx']
+        for argv in (['-d', str(outdir)], ['-X', '-o', combined]):
+            exitcode, errors = run_error_lines(argv + args + ['--timeout', '0.5'] + inputs)
+            assert exitcode == 3
+            assert errors == ['Skipped file: tests/docx/in/02.docx: took longer than 0.5 seconds']
+
+        if args == ['--compress', 'gzip']:
+            import gzip
+            assert sorted(os.listdir(str(outdir))) == ['01.txt.gz', '03.txt.gz']
+            with gzip.open(combined, 'rt') as fp:
+                assert fp.read() == 'text\n\ntext\n\n'
+        else:
+            assert sorted(os.listdir(str(outdir))) == ['01.txt', '03.txt']
+            assert tmpdir.join('combined.txt').read() == 'text\n\ntext\n\n'
+
+    def test_error_outranks_limit(self, tmpdir):
+        bomb = self.make_bomb(tmpdir)
+        exitcode, errors = run_error_lines(['-d', str(tmpdir), '--max-size', '1', 'tests/test_off2txt.py', bomb])
+        assert exitcode == 2
+        assert len(errors) == 2
+
+
+class TestSheets(object):
+    def make_workbook(self, tmpdir):
+        import openpyxl
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = 'First'
+        ws.append([u'a', u'b'])
+        ws.append([u'中文 text', 2])
+        ws = wb.create_sheet(u'Q1 "x"')
+        ws.append([u'x', u'y'])
+        wb.create_sheet(u'Empty')
+        workbook = str(tmpdir.join('multi.xlsx'))
+        wb.save(workbook)
+        return workbook
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_sheets(self, tmpdir, engine):
+        workbook = self.make_workbook(tmpdir)
+        serial = str(tmpdir.mkdir('serial'))
+        parallel = str(tmpdir.mkdir('parallel'))
+
+        argv = ['--engine', engine, '-s', '--sheets', '-d', serial, workbook]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert read_outputs(serial) == {
+            'multi-First-ascii.csv': u'a, b\n text, 2\n',
+            'multi-First-unicode.csv': u', \n中文, 2\n',
+            'multi-Q1 _x_-ascii.csv': u'x, y\n',
+            'multi-Q1 _x_-unicode.csv': u', \n',
+        }
+
+        argv = ['-j', '3', '--engine', engine, '-s', '--sheets', '-d', parallel, workbook]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert read_outputs(parallel) == read_outputs(serial)
+
+        pipeline = str(tmpdir.mkdir('pipeline'))
+        argv = ['--prefetch', '2', '-j', '3', '--engine', engine, '-s', '--sheets', '-d', pipeline, workbook]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert read_outputs(pipeline) == read_outputs(serial)
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_sheet_name_clash(self, tmpdir, engine):
+        import openpyxl
+        wb = openpyxl.Workbook()
+        for i, title in enumerate([u'a<b', u'a>b', u'A_b']):
+            ws = wb.active if i == 0 else wb.create_sheet()
+            ws.title = title
+            ws.append([title])
+        workbook = str(tmpdir.join('clash.xlsx'))
+        wb.save(workbook)
+
+        expected = {'clash-a_b.csv': u'a<b\n', 'clash-a_b-2.csv': u'a>b\n', 'clash-A_b-3.csv': u'A_b\n'}
+        for args in ([], ['-j', '3']):
+            outdir = str(tmpdir.mkdir('out%d' % len(args)))
+            argv = ['--engine', engine, '--sheets', '-d', outdir, workbook] + args
+            assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+            assert read_outputs(outdir) == expected
+
+    def test_sheets_manifest(self, tmpdir):
+        workbook = self.make_workbook(tmpdir)
+        outdir = tmpdir.mkdir('out')
+        manifest = str(tmpdir.join('manifest.db'))
+        argv = ['-j', '2', '-s', '--sheets', '--manifest', manifest, '-d', str(outdir), workbook]
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+
+        # recorded once with the outputs of every sheet, so a removed sheet output is made again
+        import sqlite3
+        db = sqlite3.connect(manifest)
+        rows = db.execute('select outputs from files').fetchall()
+        db.close()
+        assert len(rows) == 1
+        assert len(json.loads(rows[0][0])) == 4
+
+        outdir.join('multi-Q1 _x_-ascii.csv').remove()
+        assert off2txt.off2txt.main(argv, stdout=StringIO(), stderr=StringIO()) == 0
+        assert outdir.join('multi-Q1 _x_-ascii.csv').check()
+
+
+class TestCache(object):
+    inputs = ['tests/docx/in/02.docx', 'tests/pptx/in/03.pptx', 'tests/xlsx/in/02.xlsx']
+
+    def test_cache_hits(self, tmpdir, monkeypatch):
+        cache_dir = str(tmpdir.join('cache'))
+        first = str(tmpdir.mkdir('first'))
+        second = str(tmpdir.mkdir('second'))
+
+        argv = ['-X', '-s', '--cache-dir', cache_dir, '-d', first] + self.inputs
+        assert run_error_lines(argv) == (0, ['Cache: 0 hits, 3 misses, 0 evicted'])
+
+        # a hit must not parse the document
+        def fail(options, filename):
+            raise AssertionError('parsed %s' % filename)
+        for ext in ('.docx', '.pptx', '.xlsx'):
+            monkeypatch.setitem(off2txt.off2txt.engines['library'], ext, fail)
+
+        argv = ['-X', '-s', '--cache-dir', cache_dir, '-d', second] + self.inputs
+        assert run_error_lines(argv) == (0, ['Cache: 3 hits, 0 misses, 0 evicted'])
+        assert read_outputs(first) == read_outputs(second)
+
+    def test_cache_engine_is_part_of_key(self, tmpdir):
+        cache_dir = str(tmpdir.join('cache'))
+        argv = ['-X', '--cache-dir', cache_dir, '-d', str(tmpdir), self.inputs[0]]
+        assert run_error_lines(argv) == (0, ['Cache: 0 hits, 1 misses, 0 evicted'])
+        assert run_error_lines(['--engine', 'fast'] + argv) == (0, ['Cache: 0 hits, 1 misses, 0 evicted'])
+        assert run_error_lines(['--engine', 'fast'] + argv) == (0, ['Cache: 1 hits, 0 misses, 0 evicted'])
+
+    def test_cache_size(self, tmpdir):
+        cache_dir = str(tmpdir.join('cache'))
+        argv = ['-X', '--cache-size', '0', '--cache-dir', cache_dir, '-d', str(tmpdir)] + self.inputs
+        assert run_error_lines(argv) == (0, ['Cache: 0 hits, 3 misses, 3 evicted'])
+        assert run_error_lines(argv) == (0, ['Cache: 0 hits, 3 misses, 3 evicted'])
+
+    def test_cache_bad_entries(self, tmpdir):
+        cache_dir = str(tmpdir.join('cache'))
+        first = str(tmpdir.mkdir('first'))
+        second = str(tmpdir.mkdir('second'))
+        argv = ['-X', '-s', '--cache-dir', cache_dir, '-d', first] + self.inputs
+        assert run_error_lines(argv) == (0, ['Cache: 0 hits, 3 misses, 0 evicted'])
+
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(cache_dir):
+            entries.extend(os.path.join(dirpath, f) for f in filenames)
+        assert len(entries) == 3
+        for entry in entries:
+            with open(entry, 'rb') as fp:
+                data = fp.read()
+            if b'"is_list":false' in data:
+                # rows that stop part way through a row
+                data = data[:-1]
+            else:
+                data = b'\x80\x04not an entry'
+            with open(entry, 'wb') as fp:
+                fp.write(data)
+
+        argv = ['-X', '-s', '--cache-dir', cache_dir, '-d', second] + self.inputs
+        assert run_error_lines(argv) == (0, ['Cache: 0 hits, 3 misses, 0 evicted'])
+        assert read_outputs(first) == read_outputs(second)
+        assert run_error_lines(argv) == (0, ['Cache: 3 hits, 0 misses, 0 evicted'])
+        assert read_outputs(first) == read_outputs(second)
+
+    def test_cache_row_values(self):
+        import datetime
+        from off2txt.cache import decode_line, encode_line
+        row = (None, 1, 2.5, True, u'中文', datetime.datetime(2020, 1, 2, 3, 4, 5, 6), datetime.date(2020, 1, 2), datetime.time(3, 4), datetime.timedelta(days=1, seconds=2))
+        assert decode_line(encode_line(row)) == row
+
+
+class TestRecursive(object):
+    def make_tree(self, tmpdir):
+        top = tmpdir.mkdir('tree')
+        shutil.copy('tests/docx/in/01.docx', str(top))
+        shutil.copy('tests/pptx/in/02.pptx', str(top.mkdir('a')))
+        shutil.copy('tests/xlsx/in/03.xlsx', str(top.mkdir('b').mkdir('c')))
+        top.join('notes.txt').write('not an office file')
+        return top
+
+    def test_recursive(self, tmpdir):
+        top = self.make_tree(tmpdir)
+        assert run_errors(['-X', '-r', str(top)]) == (0, '')
+        assert top.join('01.txt').check()
+        assert top.join('a', '02.txt').check()
+        assert top.join('b', 'c', '03.csv').check()
+        assert not top.join('notes.txt.txt').check()
+
+    def test_walk_without_scandir(self, tmpdir, monkeypatch):
+        top = self.make_tree(tmpdir)
+        options = off2txt.options.parse_opts(['-r', str(top)], stderr=StringIO())
+        walked = list(off2txt.off2txt.walk_directory(options, str(top)))
+        monkeypatch.delattr(os, 'scandir')
+        assert list(off2txt.off2txt.walk_directory(options, str(top))) == walked
+        assert walked == [str(top.join('01.docx')), str(top.join('a', '02.pptx')), str(top.join('b', 'c', '03.xlsx'))]
+
+    def test_directory_without_recursive(self, tmpdir):
+        top = self.make_tree(tmpdir)
+        assert run_errors([str(top)]) == (2, 'Unknown extension: \n')
+
+    def test_manifest(self, tmpdir, monkeypatch):
+        top = self.make_tree(tmpdir)
+        manifest = str(tmpdir.join('manifest.db'))
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)]) == (0, '')
+
+        parsed = []
+
+        def word(options, fp):
+            parsed.append(fp.name)
+            return [u'changed']
+        monkeypatch.setitem(off2txt.off2txt.engines['library'], '.docx', word)
+        monkeypatch.setitem(off2txt.off2txt.engines['library'], '.pptx', word)
+        monkeypatch.setitem(off2txt.off2txt.engines['library'], '.xlsx', word)
+
+        # nothing has changed
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)]) == (0, '')
+        assert parsed == []
+
+        # changed and missing outputs are extracted again
+        docx = top.join('01.docx')
+        st = os.stat(str(docx))
+        os.utime(str(docx), (st.st_atime, st.st_mtime + 10))
+        top.join('a', '02.txt').remove()
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)]) == (0, '')
+        assert parsed == [str(docx), str(top.join('a', '02.pptx'))]
+
+    @pytest.mark.parametrize('args', [['-j', '2'], ['-j', '2', '--prefetch', '2']])
+    def test_manifest_jobs(self, tmpdir, args):
+        top = self.make_tree(tmpdir)
+        manifest = str(tmpdir.join('manifest.db'))
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)] + args) == (0, '')
+        top.join('01.txt').remove()
+        # an unchanged input is not written again
+        top.join('b', 'c', '03.csv').write('unchanged')
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)] + args) == (0, '')
+        assert top.join('01.txt').check()
+        assert top.join('b', 'c', '03.csv').read() == 'unchanged'
+
+    def test_manifest_options(self, tmpdir):
+        top = self.make_tree(tmpdir)
+        manifest = str(tmpdir.join('manifest.db'))
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)]) == (0, '')
+
+        # other output options extract again
+        assert run_errors(['-X', '-s', '-r', '--manifest', manifest, str(top)]) == (0, '')
+        assert top.join('01-ascii.txt').check()
+        outdir = tmpdir.mkdir('out')
+        assert run_errors(['-X', '-d', str(outdir), '-r', '--manifest', manifest, str(top)]) == (0, '')
+        assert outdir.join('01.txt').check()
+
+        # a combined output that is truncated gets every input again
+        combined = tmpdir.join('combined.txt')
+        for i in range(2):
+            assert run_errors(['-X', '-o', str(combined), '-r', '--manifest', manifest, str(top)]) == (0, '')
+            assert u'This is the heading' in combined.read_text('utf8')
+
+    def test_manifest_without_options(self, tmpdir):
+        import sqlite3
+        manifest = str(tmpdir.join('manifest.db'))
+        db = sqlite3.connect(manifest)
+        db.execute('create table files (path text primary key, size integer not null, mtime integer not null, outputs text not null)')
+        db.commit()
+        db.close()
+        top = self.make_tree(tmpdir)
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)]) == (0, '')
+        assert run_errors(['-X', '-r', '--manifest', manifest, str(top)]) == (0, '')
+
+
+class TestLazyImports(object):
+    backends = ('docx', 'pptx', 'openpyxl', 'lxml')
+
+    def loaded_backends(self, code):
+        top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code += '; import sys; print(" ".join(m for m in %r if m in sys.modules))' % (self.backends, )
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=top)
+        return out.decode().split()
+
+    def test_import(self):
+        assert self.loaded_backends('import off2txt.off2txt') == []
+
+    @pytest.mark.parametrize('path,loaded', [
+        ('tests/docx/in/01.docx', ['docx', 'lxml']),
+        ('tests/pptx/in/01.pptx', ['pptx', 'lxml']),
+        ('tests/xlsx/in/01.xlsx', ['openpyxl', 'lxml']),
+    ])
+    def test_single_format(self, tmpdir, path, loaded):
+        code = 'import off2txt.off2txt; off2txt.off2txt.main(["-X", "-d", %r, %r])' % (str(tmpdir), path)
+        assert self.loaded_backends(code) == loaded
+
+    def test_run_module(self):
+        # python -m off2txt loads the command line module once, without a warning
+        top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.Popen([sys.executable, '-m', 'off2txt', '--version'], cwd=top, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        assert (proc.returncode, stderr) == (0, b'')
+        assert stdout.decode().startswith('off2txt ')
+
+
+class TestServer(object):
+    def start(self, tmpdir, *args):
+        top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        sock = str(tmpdir.join('off2txt.sock'))
+        cmd = [sys.executable, '-m', 'off2txt', '--serve', sock] + list(args)
+        server = subprocess.Popen(cmd, cwd=top)
+        for i in range(200):
+            if os.path.exists(sock):
+                break
+            time.sleep(0.05)
+        return server, sock
+
+    def stop(self, server, sock):
+        server.terminate()
+        assert server.wait() == 0
+        assert not os.path.exists(sock)
+
+    @pytest.mark.parametrize('args', [[], ['-j', '2']])
+    def test_server(self, tmpdir, args):
+        server, sock = self.start(tmpdir, *args)
+        try:
+            outdir = tmpdir.mkdir('out')
+            argv = ['--connect', sock, '-X', '-s', '-d', str(outdir), 'tests/docx/in/02.docx', 'tests/xlsx/in/01.xlsx']
+            assert run(argv) == (0, '', '')
+            for name in ('02-ascii.txt', '02-unicode.txt', '01-ascii.csv', '01-unicode.csv'):
+                assert outdir.join(name).check()
+
+            assert run(['--connect', sock, 'tests/docx/in/nothere.docx']) == (1, '', 'File does not exist: tests/docx/in/nothere.docx\n')
+
+            # errors come back from the server
+            exitcode, stdout, stderr = run(['--conn=' + sock, '--engine', 'fast', 'tests/test_off2txt.py'])
+            assert (exitcode, stderr) == (2, 'Unknown extension: .py\n')
+        finally:
+            self.stop(server, sock)
+
+    @pytest.mark.parametrize('args', [[], ['-j', '2'], ['-j', '2', '--prefetch', '2']])
+    def test_client_directory(self, tmpdir, monkeypatch, args):
+        server, sock = self.start(tmpdir, '-j', '2')
+        try:
+            assert stat.S_IMODE(os.stat(sock).st_mode) == 0o600
+            client = tmpdir.mkdir('client')
+            client.mkdir('in')
+            shutil.copy('tests/docx/in/02.docx', str(client.join('in', '02.docx')))
+            monkeypatch.chdir(str(client))
+            assert run(['--connect', sock, '-X', '-d', 'out'] + args + ['in/02.docx']) == (0, '', '')
+            assert client.join('out', '02.txt').check()
+        finally:
+            self.stop(server, sock)
+
+    def test_stop_during_request(self, tmpdir):
+        server, sock = self.start(tmpdir)
+        try:
+            # long enough to still be running when the server is stopped
+            names = tmpdir.join('names')
+            names.write_binary(b'tests/docx/in/02.docx\0' * 2000)
+            outdir = tmpdir.mkdir('out')
+            results = []
+            argv = ['--connect', sock, '-X', '-d', str(outdir), '--files-from', str(names)]
+            client = threading.Thread(target=lambda: results.append(run(argv)))
+            client.start()
+            time.sleep(0.5)
+            server.send_signal(signal.SIGTERM)
+            client.join()
+            assert results == [(0, '', '')]
+            assert outdir.join('02.txt').check()
+            assert server.wait() == 0
+            assert not os.path.exists(sock)
+        finally:
+            if server.poll() is None:
+                server.kill()
+                server.wait()
+
+    @pytest.mark.parametrize('argv,expected', [
+        (['--connect', 'S', '-X', 'a.docx'], ['-X', 'a.docx']),
+        (['--connect=S', 'a.docx'], ['a.docx']),
+        (['-X', '--conn', 'S', 'a.docx'], ['-X', 'a.docx']),
+        (['--con=S', 'a.docx'], ['a.docx']),
+        (['--connect', 'S', '--', '--conn.docx'], ['--', '--conn.docx']),
+    ])
+    def test_strip_connect(self, argv, expected):
+        from off2txt.server import strip_connect
+        assert strip_connect(argv) == expected
+
+    def test_files_from_stdin(self, tmpdir, capsys):
+        with pytest.raises(SystemExit):
+            off2txt.options.parse_opts(['--connect', str(tmpdir.join('none.sock')), '--files-from', '-'])
+        assert 'not allowed with --connect' in capsys.readouterr().err
+
+        # a request sent without the client is turned down by the server
+        from off2txt.server import run_request
+        options = off2txt.options.parse_opts(['--serve', str(tmpdir.join('none.sock'))])
+        options.pool = None
+        response = run_request(options, {'argv': ['--files-from', '-'], 'cwd': os.getcwd()})
+        assert response['exit_status'] == 2
+        assert response['stderr'] == 'Server requests cannot read names from standard input\n'
+
+    def test_no_server(self, tmpdir):
+        exitcode, stdout, stderr = run(['--connect', str(tmpdir.join('none.sock')), 'tests/docx/in/01.docx'])
+        assert exitcode == 2
+        assert stderr.startswith('Exception connecting to server on: ')
+
+
+class TestExtract(object):
+    def read_lines(self, path):
+        with codecs.open(path, 'r', 'utf8') as fp:
+            return [l for l in fp.read().split('\n') if l]
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_extract_path(self, engine):
+        text_runs = off2txt.extract('tests/docx/in/03.docx', engine=engine)
+        assert not isinstance(text_runs, list)
+        assert list(text_runs) == self.read_lines('tests/docx/out/03.txt')
+
+    @pytest.mark.parametrize('ext', ['.docx', '.pptx', '.xlsx'])
+    def test_extract_lazy(self, monkeypatch, ext):
+        # nothing is parsed before the first item is asked for
+        calls = []
+        parse = off2txt.off2txt.engines['library'][ext]
+
+        def record(options, source):
+            calls.append(source)
+            return parse(options, source)
+        monkeypatch.setitem(off2txt.off2txt.engines['library'], ext, record)
+
+        text_runs = off2txt.extract('tests/%s/in/01%s' % (ext[1:], ext))
+        assert calls == []
+        next(text_runs)
+        assert len(calls) == 1
+
+    @pytest.mark.parametrize('engine', ['library', 'fast'])
+    def test_extract_bytes_and_file(self, engine):
+        with open('tests/pptx/in/01.pptx', 'rb') as fp:
+            data = fp.read()
+        expected = list(off2txt.extract('tests/pptx/in/01.pptx', engine=engine))
+        assert list(off2txt.extract(data, engine=engine)) == expected
+        with open('tests/pptx/in/01.pptx', 'rb') as fp:
+            assert list(off2txt.extract(fp, engine=engine)) == expected
+
+    def test_extract_split(self):
+        pairs = list(off2txt.extract('tests/docx/in/02.docx', split=True))
+        assert [a for a, u in pairs if a] == self.read_lines('tests/docx/out/02-ascii.txt')
+        assert [u for a, u in pairs if u] == self.read_lines('tests/docx/out/02-unicode.txt')
+
+    def test_extract_xlsx(self):
+        with open('tests/xlsx/in/02.xlsx', 'rb') as fp:
+            rows = list(off2txt.extract(fp.read(), split=True, engine='fast'))
+        assert rows[0] == ([u'a1 ', u'b1 ', u'c1 '], [u'\u4e2d\u6587', u'\u4e2d\u6587', u'\u4e2d\u6587'])
+        assert len(rows) == 2
+
+    def test_extract_errors(self):
+        with pytest.raises(ValueError):
+            off2txt.extract(b'not a zip file')
+        with pytest.raises(ValueError):
+            off2txt.extract('tests/docx/in/01.docx', engine='bogus')
+
+
 if __name__ == '__main__':
     pytest.main()
 